@@ -0,0 +1,25 @@
+'''
+Updates RAWS and PSA ERC and BI Percentiles and Trends tables using NFDRS observations and
+forecasts from FEMS.
+
+The run is split into stages that take data frames in and return data frames out:
+
+- indices: the fuel model and index pairs analyzed, set by configuration
+- fems: fetch NFDRS observations and forecasts from FEMS
+- agol: load the reference and target tables from AGOL and publish results
+- raws: RAWS percentiles and 3-day trends
+- psa: PSA aggregation of the RAWS results
+- spatial: station-to-PSA membership from RAWS locations and PSA boundaries
+- pipeline: runs the stages in order; cli is the command line entry point
+
+The computation stages (fems, raws, psa, percentiles, trends) do not need the arcgis package.
+'''
+
+from .config import DEFAULTS, load_config
+from .indices import DEFAULT_INDICES, FEMS_INDEX_FIELDS, result_fields
+from .fems import fems_dates, fetch_fems, fetch_fems_data, FEMSDownloadError
+from .percentiles import build_percentile_lookup, build_percentile_lookups, compile_percentiles, load_percentiles, lookup_percentiles
+from .trends import TREND_LABELS, classify_trends, trend_summary
+from .raws import pivot_fems, station_values, compute_raws
+from .psa import aggregate_psa
+from .spatial import spatial_associations
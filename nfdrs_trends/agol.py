@@ -0,0 +1,357 @@
+'''
+Reads the reference and target tables from the AGOL feature service and publishes updated rows.
+'''
+
+# Import libraries and modules
+import os, json, random, logging, types, importlib.util, pandas, numpy, requests
+from datetime import datetime
+from time import sleep
+from concurrent.futures import ThreadPoolExecutor
+from .metrics import metrics
+from .indices import DEFAULT_INDICES, lookup_key
+from .schema import service_frame
+from .percentiles import build_percentile_lookups, save_percentiles, load_percentiles
+
+log = logging.getLogger(__name__)
+
+def rest_json(response):
+    '''
+    Returns the JSON body of an ArcGIS REST response, raising an error for HTTP errors and for
+    error bodies (which the REST API sends with status 200).
+    '''
+    response.raise_for_status()
+    data = response.json()
+    if('error' in data):
+        raise RuntimeError('ArcGIS REST error: ' + str(data['error']))
+    return data
+
+class RestTable:
+    '''
+    Minimal client for one feature service table over the ArcGIS REST API, for services that
+    don't need portal sign-in (e.g. the local mock server). Supports the calls made on arcgis
+    tables here: properties, query(where).df and edit_features(updates=...).
+    '''
+    def __init__(self, url, session):
+        self.url = url
+        self.session = session
+        self._properties = None
+
+    @property
+    def properties(self):
+        if(self._properties is None):
+            response = self.session.get(self.url,params={'f': 'json'})
+            rest_json(response) # Raise for errors
+            self._properties = json.loads(response.text,object_hook=lambda d: types.SimpleNamespace(**d))
+        return self._properties
+
+    def query(self, where='1=1'):
+        '''
+        Returns all records matching where as a result with a .df data frame, paging through
+        the service's maxRecordCount.
+        '''
+        page_size = getattr(self.properties,'maxRecordCount',None) or 2000
+        records = []
+        while(True):
+            response = self.session.post(self.url + '/query',
+                                         data={'where': where,'outFields': '*','returnGeometry': 'false',
+                                               'resultOffset': len(records),
+                                               'resultRecordCount': page_size,'f': 'json'})
+            data = rest_json(response)
+            records.extend([feat['attributes'] for feat in data.get('features',[])])
+            if((not data.get('exceededTransferLimit',False)) | (len(data.get('features',[])) == 0)):
+                break
+        return types.SimpleNamespace(df=pandas.DataFrame(records))
+
+    def edit_features(self, updates):
+        '''
+        Sends updates (a FeatureSet or a list of features) with applyEdits and returns the
+        response, including the per-feature updateResults.
+        '''
+        features = getattr(updates,'features',updates)
+        features = [{'attributes': feat.attributes if hasattr(feat,'attributes') else feat['attributes']}
+                    for feat in features]
+        response = self.session.post(self.url + '/applyEdits',
+                                     data={'updates': json.dumps(features,default=str),'f': 'json'})
+        return rest_json(response)
+
+class RestService:
+    '''
+    Feature service reached directly by its FeatureServer URL, with the modified time and tables
+    of a service item.
+    '''
+    def __init__(self, url, session):
+        self.url = url.rstrip('/')
+        info = rest_json(session.get(self.url,params={'f': 'json'}))
+        self.modified = info.get('editingInfo',{}).get('lastEditDate')
+        self.tables = [RestTable(self.url + '/' + str(tbl['id']),session)
+                       for tbl in sorted(info.get('tables',[]),key=lambda tbl: tbl['id'])]
+
+def connect(config):
+    '''
+    Connects to the ArcGIS Online Org and feature service. Returns the service item and its
+    tables (Percentiles, PSA_RAWS_Associations, RAWS_Percentiles_Trends, PSA_Percentiles_Trends).
+    If feature_service_url is set, the service is used directly without signing in to the portal
+    (and without the arcgis package).
+    '''
+    if(config.get('feature_service_url')):
+        session = requests.Session()
+        session.hooks['response'].append(
+            lambda r, *args, **kwargs: metrics.count_http('AGOL',len(r.content)))
+        with metrics.timed('AGOL connect'):
+            service = RestService(config['feature_service_url'],session)
+        log.info('.Connected to feature service at ' + service.url)
+        return service, service.tables
+
+    # Establish connection to the ArcGIS Online Org
+    from arcgis.gis import GIS
+    with metrics.timed('AGOL connect'):
+        gis = GIS(config['agol_portalurl'],config['agol_username'],config['agol_password'])
+    log.info('.Connected to AGOL')
+
+    # Count AGOL requests and bytes (relies on the arcgis connection's requests session)
+    try:
+        gis._con._session.hooks['response'].append(
+            lambda r, *args, **kwargs: metrics.count_http('AGOL',r.headers.get('Content-Length') or
+                                                          len(r.content)))
+    except AttributeError:
+        log.debug('.AGOL request counting not available')
+
+    # Connect to feature service
+    service = gis.content.get(config['itemid'])
+    log.info('.Connected to feature service')
+    return service, service.tables
+
+def table_edit_token(service, table):
+    '''
+    Returns a token that changes whenever AGOL reports an edit to the table, using the table's
+    last edit date when edit tracking is available and the service item's modified time if not.
+    '''
+    try:
+        token = table.properties.editingInfo.lastEditDate
+    except Exception:
+        token = None
+    if(token is None):
+        token = service.modified
+    return str(token)
+
+def load_cached_table(table, name, token, cache_dir):
+    '''
+    Loads a reference table from the local cache if it was saved under the same edit token,
+    otherwise queries AGOL and refreshes the cache. Tables are stored as Parquet when pyarrow is
+    available and as pickles if not. Returns the table and whether it came from the cache.
+    '''
+    ext = '.parquet' if importlib.util.find_spec('pyarrow') is not None else '.pkl'
+    path = os.path.join(cache_dir,name + ext)
+    token_path = os.path.join(cache_dir,name + '.json')
+    if(os.path.exists(path) & os.path.exists(token_path)):
+        with open(token_path) as tf:
+            cached_token = json.load(tf).get('token')
+        if(cached_token == token):
+            if(ext == '.parquet'):
+                return pandas.read_parquet(path), True
+            return pandas.read_pickle(path), True
+
+    # Download and refresh the cache, writing the token last so a partial write is never reused
+    df = table.query().df
+    try:
+        os.makedirs(cache_dir,exist_ok=True)
+        if(ext == '.parquet'):
+            df.to_parquet(path + '.tmp',index=False)
+        else:
+            df.to_pickle(path + '.tmp')
+        os.replace(path + '.tmp',path)
+        with open(token_path,'w') as tf:
+            json.dump({'token': token,'saved': datetime.now().isoformat(timespec='seconds')},tf)
+    except Exception:
+        pass # Cache is optional, continue with the downloaded table
+    return df, False
+
+def load_percentile_lookups(service, tables, cache_dir=None, indices=DEFAULT_INDICES):
+    '''
+    Returns the percentile lookups of the fuel model and index pairs in indices, memory-mapped
+    from the local cache under cache_dir if the Percentiles table is unchanged in AGOL. The
+    Percentiles table is only needed to (re)build the lookups. If the lookups can't be written to
+    the cache they are used from memory.
+    '''
+    with metrics.timed('AGOL reference tables'):
+        if(cache_dir is not None):
+            per_path = os.path.join(cache_dir,'percentiles')
+            per_token = table_edit_token(service,tables[0])
+            per_keys = [lookup_key(spec) for spec in indices]
+            per_lookups = load_percentiles(per_path,per_token,per_keys)
+            if(per_lookups is None):
+                per_df, per_cached = load_cached_table(tables[0],'Percentiles',per_token,cache_dir)
+                log.info('.Percentiles table ' + ('loaded from cache' if per_cached else 'downloaded'))
+                per_lookups = build_percentile_lookups(per_df,indices)
+                try:
+                    save_percentiles(per_lookups,per_path,per_token)
+                    per_lookups = load_percentiles(per_path,per_token,per_keys)
+                    log.info('.Percentile lookups compiled')
+                except Exception:
+                    log.warning('.Percentile lookups could not be cached under ' + per_path +
+                                ', using them from memory',exc_info=True)
+            else:
+                log.info('.Percentile lookups memory-mapped from cache')
+        else:
+            per_df = tables[0].query().df
+            per_lookups = build_percentile_lookups(per_df,indices)
+    return per_lookups
+
+def load_associations(service, tables, cache_dir=None):
+    '''
+    Returns the PSA_RAWS_Associations table, from the local cache under cache_dir if unchanged in
+    AGOL.
+    '''
+    with metrics.timed('AGOL reference tables'):
+        if(cache_dir is not None):
+            pra_df, pra_cached = load_cached_table(tables[1],'PSA_RAWS_Associations',
+                                                   table_edit_token(service,tables[1]),cache_dir)
+            log.info('.PSA_RAWS_Associations table ' + ('loaded from cache' if pra_cached else
+                                                        'downloaded'))
+        else:
+            pra_df = tables[1].query().df
+    return pra_df
+
+def load_reference_tables(service, tables, cache_dir=None, indices=DEFAULT_INDICES):
+    '''
+    Returns the percentile lookups of the fuel model and index pairs in indices and the
+    PSA_RAWS_Associations table, from the local cache under cache_dir if unchanged in AGOL.
+    '''
+    return (load_percentile_lookups(service,tables,cache_dir,indices),
+            load_associations(service,tables,cache_dir))
+
+def load_target_table(tbl, field, values):
+    '''
+    Returns the rows of a target table whose field is one of values.
+    '''
+    with metrics.timed('AGOL target tables'):
+        whereClause = '"' + field + '"' + ' IN ' + str(tuple(values))
+        return tbl.query(whereClause).df
+
+def load_target_tables(tables, pra_df):
+    '''
+    Returns the RAWS_Percentiles_Trends and PSA_Percentiles_Trends rows for the stations and PSAs
+    in the PSA_RAWS_Associations table.
+    '''
+    return (load_target_table(tables[2],'Station_ID',pra_df['Station_ID'].tolist()),
+            load_target_table(tables[3],'PSANationalCode',pra_df['PSA'].tolist()))
+
+def object_id_field(tbl):
+    '''
+    Returns the name of the table's object ID field (e.g. OBJECTID, ObjectId or FID), or
+    OBJECTID if the service doesn't report it.
+    '''
+    try:
+        key = tbl.properties.objectIdField
+    except Exception:
+        key = None
+    return key or 'OBJECTID'
+
+def changed_rows(new_df, old_df, key='OBJECTID', ignore=[]):
+    '''
+    Returns the rows of new_df whose attribute values differ from the matching row (by key) in
+    old_df. Missing values compare equal to each other, and rows not found in old_df count as
+    changed.
+    '''
+    cols = [col for col in new_df.columns if (col in old_df.columns) & (col not in ignore) &
+            (col != key)]
+    old = old_df.drop_duplicates(key).set_index(key).reindex(new_df[key])
+    changed = ~new_df[key].isin(old_df[key]).to_numpy()
+    for col in cols:
+        new_vals = new_df[col].astype(object)
+        old_vals = old[col].astype(object)
+        new_vals = numpy.asarray(new_vals.where(new_vals.notna(),None))
+        old_vals = numpy.asarray(old_vals.where(old_vals.notna(),None))
+        changed |= (new_vals != old_vals)
+    return new_df.loc[changed]
+
+def upload_chunk(tbl, df, attempts=5, backoff=1, max_wait=30, key=None):
+    '''
+    Sends one chunk of rows to the table as updates. After each attempt the per-feature
+    updateResults are checked and only the object IDs not reported as successful are re-sent,
+    waiting with exponential backoff and jitter between attempts. A failed request or a response
+    without updateResults re-sends the whole chunk. key is the object ID field (default the
+    table's, see object_id_field). Returns the object IDs that never succeeded.
+    '''
+    if(key is None):
+        key = object_id_field(tbl)
+    for attempt in range(0,attempts):
+        try:
+            # tbl.properties.capabilities # Make sure editing enabled
+            if(isinstance(tbl,RestTable)):
+                updates = [{'attributes': row} for row in df.to_dict('records')]
+            else:
+                import arcgis.features
+                updates = arcgis.features.FeatureSet.from_dataframe(df)
+            with metrics.timed('AGOL edit_features'):
+                result = tbl.edit_features(updates=updates)
+            if('updateResults' not in result):
+                raise RuntimeError('No updateResults in response: ' + str(result)[:500])
+            succeeded = [res.get('objectId') for res in result['updateResults'] if res.get('success',False)]
+            df = df.loc[~df[key].isin(succeeded)]
+        except Exception:
+            log.warning('..Upload request failed', exc_info=True) # Re-send the whole chunk
+        if(df.shape[0] == 0):
+            return []
+        if(attempt < attempts - 1):
+            log.warning('..Upload of ' + str(df.shape[0]) + ' row(s) failed, re-trying')
+            metrics.count_retry('AGOL upload')
+            sleep(min(max_wait,backoff * 2 ** attempt) * random.uniform(0.5,1.5))
+    return df[key].tolist()
+
+def upload_tables(jobs, chunk_size=500, workers=4, attempts=5, backoff=1, max_wait=30):
+    '''
+    Uploads several tables at once. jobs is a list of (name, table, frame); every frame is split
+    into chunks of at most chunk_size rows and all chunks are sent concurrently. Returns the
+    object IDs that failed to update, keyed by table name.
+    '''
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = []
+        for name, tbl, df in jobs:
+            key = object_id_field(tbl)
+            for i in range(0,df.shape[0],chunk_size):
+                futures.append((name,pool.submit(upload_chunk,tbl,df.iloc[i:i + chunk_size],attempts,
+                                                 backoff,max_wait,key)))
+        failed = {name: [] for name, tbl, df in jobs}
+        for name, future in futures:
+            failed[name].extend(future.result())
+    return failed
+
+def publish(tables, raws_df, raws_prev, psa_df, psa_prev, config):
+    '''
+    Updates the RAWS_Percentiles_Trends and PSA_Percentiles_Trends tables concurrently. With
+    upload_changed_only, only rows whose values changed since they were read from the service
+    (raws_prev, psa_prev) are sent. Returns the object IDs that failed, keyed by table.
+    '''
+    raws_upd = rows_to_upload('RAWS',tables[2],raws_df,raws_prev,config)
+    psa_upd = rows_to_upload('PSA',tables[3],psa_df,psa_prev,config)
+
+    # Update RAWS and PSA tables concurrently
+    upload_failed = upload_tables([('RAWS',tables[2],raws_upd),('PSA',tables[3],psa_upd)],
+                                  config['upload_chunk_size'],config['upload_workers'],
+                                  config['upload_attempts'])
+    report_failed(upload_failed,config['upload_attempts'])
+    return upload_failed
+
+def rows_to_upload(name, tbl, df, prev, config):
+    '''
+    Returns the rows of one results table (tbl) to send, as plain values with None for missing
+    (see schema.service_frame). With upload_changed_only, only rows whose values changed since
+    prev was read from the service are kept.
+    '''
+    df = service_frame(df)
+    if(config['upload_changed_only']):
+        upd = changed_rows(df,service_frame(prev),object_id_field(tbl),config['diff_ignore_fields'])
+    else:
+        upd = df
+    log.info('.' + name + ' table: ' + str(upd.shape[0]) + ' of ' + str(df.shape[0]) + ' rows to update')
+    return upd
+
+def report_failed(upload_failed, attempts):
+    '''
+    Logs the tables that had rows fail to update.
+    '''
+    for name, ids in upload_failed.items():
+        if(len(ids) > 0):
+            log.error('..' + name + ' table failed to update ' + str(len(ids)) + ' row(s) after ' +
+                      str(attempts) + ' attempts')
@@ -0,0 +1,110 @@
+'''
+Run archive: each run's FEMS pull, RAWS results and PSA results are written as compressed
+Parquet snapshots with explicit column types to a dataset partitioned by run date and time:
+
+    <archive_dir>/fems/run_date=YYYY-MM-DD/run_time=HHMM/part-0.parquet
+    <archive_dir>/raws/run_date=YYYY-MM-DD/run_time=HHMM/part-0.parquet
+    <archive_dir>/psa/run_date=YYYY-MM-DD/run_time=HHMM/part-0.parquet
+
+Rows are sorted by station (or PSA), so read_archive can skip partitions outside a date range
+and row groups outside a station filter without reading them, e.g. for a season:
+
+    read_archive('archive','raws','2025-06-01','2025-09-30',columns=['Station_ID','erc_percentile'])
+'''
+
+# Import libraries and modules
+import os, logging, pandas
+from .indices import DEFAULT_INDICES, components, result_fields
+from .schema import exact_float64
+
+log = logging.getLogger(__name__)
+
+# Tables archived for each run, with the columns their rows are sorted by
+ARCHIVE_TABLES = {'fems': ['station_id','date'],'raws': ['Station_ID'],'psa': ['PSANationalCode']}
+
+# Text columns stored as dictionary-encoded strings
+CATEGORY_FIELDS = ['nfdr_type','fuel_model']
+
+# Text columns stored as plain strings
+STRING_FIELDS = ['date','Station_Name','PSANationalCode','update_date','update_time']
+
+def column_array(name, values, indices=DEFAULT_INDICES):
+    '''
+    Converts one column to an Arrow array of its archive type: float64 for index values and
+    percentiles, dictionary-encoded strings for trends, nfdr_type and fuel_model, strings for
+    names, dates and times, and the inferred type (strings if all missing) for anything else.
+    '''
+    import pyarrow
+    fields = result_fields(indices)
+    base = name[4:] if name.startswith('avg_') else name
+    if(name.endswith('_trend') or (name in CATEGORY_FIELDS)):
+        kind = 'category'
+    elif((base in fields) or (name in components(indices))):
+        kind = 'float'
+    elif(name in STRING_FIELDS):
+        kind = 'string'
+    else:
+        kind = None
+    if(kind == 'float'):
+        return pyarrow.array(exact_float64(values),type=pyarrow.float64(),from_pandas=True)
+    if(kind is not None):
+        array = pyarrow.array(pandas.Series(values).astype('string'),from_pandas=True).cast(pyarrow.string())
+        return array.dictionary_encode() if kind == 'category' else array
+    array = pyarrow.array(pandas.Series(values),from_pandas=True)
+    return array.cast(pyarrow.string()) if pyarrow.types.is_null(array.type) else array
+
+def archive_table(df, name, indices=DEFAULT_INDICES):
+    '''
+    Returns df as an Arrow table with the archive column types, sorted for row group skipping.
+    '''
+    import pyarrow
+    df = df.sort_values([col for col in ARCHIVE_TABLES[name] if col in df.columns],kind='stable')
+    return pyarrow.table({col: column_array(col,df[col],indices) for col in df.columns})
+
+def archive_run(tables, archive_dir, udate, utime, compression='zstd', indices=DEFAULT_INDICES):
+    '''
+    Writes the frames in tables (keyed by fems, raws and psa) as this run's snapshots, replacing
+    any earlier snapshot of the same update date and time.
+    '''
+    import pyarrow.parquet
+    for name, df in tables.items():
+        path = os.path.join(archive_dir,name,'run_date=' + udate,'run_time=' + utime)
+        os.makedirs(path,exist_ok=True)
+        pyarrow.parquet.write_table(archive_table(df,name,indices),os.path.join(path,'part-0.parquet.tmp'),
+                                    compression=compression)
+        os.replace(os.path.join(path,'part-0.parquet.tmp'),os.path.join(path,'part-0.parquet'))
+        log.info('.Archived ' + str(df.shape[0]) + ' ' + name + ' rows')
+
+def read_archive(archive_dir, name, start=None, end=None, columns=None, where=None):
+    '''
+    Reads the snapshots of one archived table (fems, raws or psa) with run dates from start
+    through end ('YYYY-MM-DD', either open) as one frame with run_date and run_time columns.
+    Partitions outside the range are never opened. where is an optional pyarrow.dataset
+    expression, e.g. pyarrow.dataset.field('Station_ID') == 20001, checked against row group
+    statistics before rows are read. columns limits the columns read. Snapshots written with
+    different indices settings are read with the union of their columns.
+    '''
+    import pyarrow, pyarrow.dataset
+    partitioning = pyarrow.dataset.partitioning(pyarrow.schema([('run_date',pyarrow.string()),
+                                                                ('run_time',pyarrow.string())]),
+                                                flavor='hive')
+    dataset = pyarrow.dataset.dataset(os.path.join(archive_dir,name),format='parquet',
+                                      partitioning=partitioning)
+    expr = None
+    if(start is not None):
+        expr = pyarrow.dataset.field('run_date') >= start
+    if(end is not None):
+        before = pyarrow.dataset.field('run_date') <= end
+        expr = before if expr is None else expr & before
+    fragments = list(dataset.get_fragments(filter=expr) if expr is not None else dataset.get_fragments())
+    if(len(fragments) == 0):
+        return pandas.DataFrame(columns=columns)
+
+    # Read with the union of the snapshot schemas, pruning partitions by run date
+    schema = pyarrow.unify_schemas([fragment.physical_schema for fragment in fragments] +
+                                   [partitioning.schema])
+    dataset = pyarrow.dataset.dataset(os.path.join(archive_dir,name),format='parquet',
+                                      partitioning=partitioning,schema=schema)
+    if(where is not None):
+        expr = where if expr is None else expr & where
+    return dataset.to_table(columns=columns,filter=expr).to_pandas()
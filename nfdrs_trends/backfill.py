@@ -0,0 +1,127 @@
+'''
+Backfill: rebuilds RAWS and PSA percentiles and trends for every update date in a range, e.g.
+for season verification and archives, without touching the service. FEMS is queried once for the
+union of the daily windows, the percentile lookups are memory-mapped by every worker process and
+days are computed in parallel. Results are written as one Parquet dataset partitioned by date:
+
+    <out>/raws/date=YYYY-MM-DD/part-0.parquet
+    <out>/psa/date=YYYY-MM-DD/part-0.parquet
+
+which can be read back with e.g. pandas.read_parquet(out + '/raws').
+'''
+
+# Import libraries and modules
+import os, json, logging, tempfile, importlib.util
+from datetime import datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor
+from .metrics import metrics
+from . import agol
+from .indices import DEFAULT_INDICES
+from .archive import archive_table
+from .fems import fems_dates, fetch_fems_data
+from .percentiles import save_percentiles, load_percentiles
+from .raws import compute_raws
+from .psa import aggregate_psa
+from .spatial import spatial_associations
+from .workers import shared, init_worker
+
+log = logging.getLogger(__name__)
+
+def date_range(sdate, edate):
+    '''
+    Returns every date from sdate through edate ('YYYY-MM-DD').
+    '''
+    start = datetime.strptime(sdate,'%Y-%m-%d')
+    n_days = (datetime.strptime(edate,'%Y-%m-%d') - start).days + 1
+    if(n_days < 1):
+        raise ValueError('Backfill end date ' + edate + ' is before start date ' + sdate)
+    return [(start + timedelta(days=i)).strftime('%Y-%m-%d') for i in range(0,n_days)]
+
+def load_shared_lookups():
+    '''
+    Memory-maps the percentile lookups in a worker process, so every worker reads the same pages.
+    '''
+    shared['per_lookups'] = load_percentiles(shared['per_path'],shared['per_token'])
+
+def write_partition(df, out_dir, name, udate, indices=DEFAULT_INDICES):
+    '''
+    Writes one day's table to its date partition with the archive column types (see
+    archive.archive_table), replacing any earlier backfill of that day.
+    '''
+    import pyarrow.parquet
+    path = os.path.join(out_dir,name,'date=' + udate)
+    os.makedirs(path,exist_ok=True)
+    pyarrow.parquet.write_table(archive_table(df,name,indices),os.path.join(path,'part-0.parquet.tmp'))
+    os.replace(os.path.join(path,'part-0.parquet.tmp'),os.path.join(path,'part-0.parquet'))
+
+def backfill_day(udate):
+    '''
+    Computes and writes the RAWS and PSA results for one update date. Returns the date and the
+    number of stations with an observed percentile for the first pair in the indices setting.
+    '''
+    dates = fems_dates(udate)
+    fd_df = shared['fd_df']
+    fd_df = fd_df.loc[(fd_df['date'] >= dates['o_sdate']) & (fd_df['date'] <= dates['f_edate'])]
+    raws_df, raws2psa_df = compute_raws(shared['raws_df'],shared['pra_df'],fd_df,shared['per_lookups'],
+                                        dates,udate,shared['utime'],shared['threshold'],shared['indices'])
+    psa_df, psa_means = aggregate_psa(shared['psa_df'],shared['pra_df'],raws2psa_df,udate,
+                                      shared['utime'],shared['threshold'],shared['indices'])
+    write_partition(raws_df,shared['out_dir'],'raws',udate,shared['indices'])
+    write_partition(psa_df,shared['out_dir'],'psa',udate,shared['indices'])
+    return udate, int(raws_df[shared['indices'][0]['field'] + '_percentile'].notna().sum())
+
+def backfill(config, sdate, edate, utime='0200', out_dir=None, workers=None):
+    '''
+    Rebuilds the RAWS and PSA results for every update date from sdate through edate at update
+    time utime and writes them under out_dir (default wdir/backfill). workers sets the number of
+    processes (default one per CPU). Returns out_dir. Raises FEMSDownloadError if FEMS data
+    can't be downloaded.
+    '''
+    if(importlib.util.find_spec('pyarrow') is None):
+        raise ImportError('Backfill results are written as Parquet, which needs pyarrow')
+    days = date_range(sdate,edate)
+    out_dir = os.path.join(config['wdir'],'backfill') if out_dir is None else out_dir
+
+    #################################################################################################
+    ### Connect to AGOL service for required base data
+    #################################################################################################
+    metrics.start_stage('Connect to AGOL service for required base data')
+    log.info('Connect to AGOL service for required base data')
+    service, tables = agol.connect(config)
+    per_lookups, pra_df = agol.load_reference_tables(service,tables,config['cache_dir'],config['indices'])
+    if(config['psa_membership'] == 'spatial'):
+        pra_df = spatial_associations(config,pra_df)
+    raws_df, psa_df = agol.load_target_tables(tables,pra_df)
+
+    #################################################################################################
+    ### Grab NFDRS observations and forecasts from FEMS
+    #################################################################################################
+    metrics.start_stage('Grab NFDRS observations and forecasts from FEMS')
+    log.info('Grab NFDRS observations and forecasts from FEMS for ' + str(len(days)) + ' update dates')
+    fd_df = fetch_fems_data(config,fems_dates(days[0])['o_sdate'],fems_dates(days[-1])['f_edate'],
+                            pra_df['Station_ID'].tolist())
+
+    #################################################################################################
+    ### Backfill RAWS and PSA NFDRS Percentiles and 3-DAY Trends
+    #################################################################################################
+    metrics.start_stage('Backfill RAWS and PSA NFDRS Percentiles and 3-DAY Trends')
+    log.info('Backfill RAWS and PSA NFDRS Percentiles and 3-DAY Trends, ' + sdate + ' to ' + edate)
+    with tempfile.TemporaryDirectory() as tmp:
+        save_percentiles(per_lookups,tmp,'backfill')
+        del per_lookups
+        inputs = {'per_path': tmp,'per_token': 'backfill','pra_df': pra_df,'raws_df': raws_df,
+                  'psa_df': psa_df,'fd_df': fd_df,'out_dir': out_dir,'utime': utime,
+                  'threshold': config['trend_threshold'],'indices': config['indices']}
+        with ProcessPoolExecutor(max_workers=workers,initializer=init_worker,
+                                 initargs=(inputs,load_shared_lookups)) as pool:
+            for udate, n_obs in pool.map(backfill_day,days):
+                log.info('.' + udate + ': ' + str(n_obs) + ' of ' + str(raws_df.shape[0]) +
+                         ' stations with observed percentiles')
+
+    # Record what the dataset covers
+    with open(os.path.join(out_dir,'_backfill.json'),'w') as bf:
+        json.dump({'start_date': sdate,'end_date': edate,'update_time': utime,
+                   'created': datetime.now().isoformat(timespec='seconds'),
+                   'tables': ['raws','psa'],'partition': 'date'},bf,indent=2)
+    log.info('.Wrote ' + str(len(days)) + ' days to ' + out_dir)
+    return out_dir
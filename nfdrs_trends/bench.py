@@ -0,0 +1,155 @@
+'''
+Offline benchmarks of the computation stages on synthetic inputs (see synthetic), e.g.
+
+    python -m nfdrs_trends.bench --stations 100 1000 10000 50000 --json bench.json
+    python -m nfdrs_trends.bench --baseline bench.json
+
+For each number of stations the FEMS response parsing, percentile compile, RAWS, PSA and
+spatial PSA membership (area weighted, uncached) stages are run in order and the best time over
+--repeat runs and the peak traced memory of each stage are reported. Needs no network access and
+no arcgis package. With --baseline, stages more than --tolerance slower than the saved results
+are reported and the exit status is 1.
+'''
+
+# Import libraries and modules
+import sys, json, argparse, tempfile, tracemalloc, pandas
+from time import perf_counter
+from concurrent.futures import ThreadPoolExecutor
+from .synthetic import make_fixtures, make_spatial_inputs, FixtureSession
+from .fems import fems_dates, fetch_fems_query, FEMS_FIELDS, FEMS_COLUMNS
+from .percentiles import compile_percentiles, load_percentiles
+from .raws import compute_raws
+from .schema import compact_fems
+from .psa import aggregate_psa
+from .spatial import spatial_associations
+from .metrics import peak_memory_mb
+
+# Stages timed for each scale, in run order
+STAGES = ['FEMS parse','Percentile compile','RAWS','PSA','PSA memberships']
+
+# Stages faster than this (seconds) are too noisy to flag as regressions
+MIN_SECONDS = 0.01
+
+def measure(func, repeat=3):
+    '''
+    Runs func repeat times and once more under tracemalloc. Returns its result, the best time in
+    seconds and the peak memory allocated during the traced run in MB.
+    '''
+    times = []
+    for i in range(0,repeat):
+        start = perf_counter()
+        result = func()
+        times.append(perf_counter() - start)
+    tracemalloc.start()
+    try:
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return result, min(times), peak / 1024 ** 2
+
+def bench_scale(n_stations, udate='2025-09-11', utime='0200', breakpoints=100, per_page=10000,
+                workers=4, repeat=3, seed=0):
+    '''
+    Benchmarks every stage on synthetic inputs for n_stations stations. Returns one record per
+    stage with its time and peak memory.
+    '''
+    fx = make_fixtures(n_stations,udate,breakpoints,seed=seed)
+    dates = fems_dates(udate)
+    session = FixtureSession(fx['fems_df'])
+    state = {}
+
+    def fems_parse():
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            buffers = fetch_fems_query(session,'offline',dates['o_sdate'],dates['f_edate'],'',
+                                       per_page,pool)[0]
+        return compact_fems(pandas.DataFrame(buffers,columns=FEMS_FIELDS).rename(columns=FEMS_COLUMNS))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        def percentile_compile():
+            compile_percentiles(fx['per_df'],tmp,'bench')
+            return load_percentiles(tmp,'bench')
+
+        stages = [('FEMS parse',fems_parse),
+                  ('Percentile compile',percentile_compile),
+                  ('RAWS',lambda: compute_raws(fx['raws_df'],fx['pra_df'],state['FEMS parse'],
+                                               state['Percentile compile'],dates,udate,utime)),
+                  ('PSA',lambda: aggregate_psa(fx['psa_df'],fx['pra_df'],state['RAWS'][1],udate,utime)),
+                  ('PSA memberships',lambda: spatial_associations(spatial))]
+        locations, boundaries = make_spatial_inputs(fx['pra_df'],tmp)
+        spatial = {'raws_locations': locations,'psa_boundaries': boundaries,'psa_weighting': 'area',
+                   'cache_dir': None}
+        records = []
+        for name, func in stages:
+            state[name], seconds, peak_mb = measure(func,repeat)
+            records.append({'stations': n_stations,'stage': name,'seconds': round(seconds,4),
+                            'peak_mb': round(peak_mb,1)})
+        state.clear() # Release the memory-mapped lookups before the directory is removed
+    return records
+
+def compare(records, baseline, tolerance=0.25):
+    '''
+    Returns the records that are more than tolerance (a fraction) slower than the matching
+    stations/stage record in baseline, each with the baseline time and ratio added.
+    '''
+    base = {(rec['stations'],rec['stage']): rec['seconds'] for rec in baseline}
+    slower = []
+    for rec in records:
+        old = base.get((rec['stations'],rec['stage']))
+        if((old is None) or (max(old,rec['seconds']) < MIN_SECONDS)):
+            continue
+        ratio = rec['seconds'] / max(old,1e-9)
+        if(ratio > 1 + tolerance):
+            slower.append(dict(rec,baseline_seconds=old,ratio=round(ratio,2)))
+    return slower
+
+def parse_args(argv=None):
+    '''
+    Parses the command line.
+    '''
+    parser = argparse.ArgumentParser(prog='nfdrs_trends.bench',
+                                     description='Benchmarks the computation stages on synthetic inputs.')
+    parser.add_argument('--stations',type=int,nargs='+',default=[100,1000,10000,50000],
+                        help='numbers of stations to benchmark (default 100 1000 10000 50000)')
+    parser.add_argument('--breakpoints',type=int,default=100,
+                        help='percentile breakpoints per station and index (default 100)')
+    parser.add_argument('--per-page',type=int,default=10000,help='FEMS records per page (default 10000)')
+    parser.add_argument('--workers',type=int,default=4,help='FEMS page workers (default 4)')
+    parser.add_argument('--repeat',type=int,default=3,help='timed runs per stage (default 3)')
+    parser.add_argument('--seed',type=int,default=0,help='random seed for the synthetic inputs')
+    parser.add_argument('--json',default=None,help='write the results to this JSON file')
+    parser.add_argument('--baseline',default=None,help='JSON results of an earlier run to compare with')
+    parser.add_argument('--tolerance',type=float,default=0.25,
+                        help='fraction slower than the baseline that counts as a regression (default 0.25)')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    '''
+    Runs the benchmarks from the command line. Returns the exit status.
+    '''
+    args = parse_args(argv)
+    records = []
+    print('{:>9}  {:<20}{:>10}{:>11}'.format('stations','stage','seconds','peak MB'))
+    for n in args.stations:
+        for rec in bench_scale(n,breakpoints=args.breakpoints,per_page=args.per_page,
+                               workers=args.workers,repeat=max(1,args.repeat),seed=args.seed):
+            print('{:>9}  {:<20}{:>10.4f}{:>11.1f}'.format(rec['stations'],rec['stage'],rec['seconds'],
+                                                           rec['peak_mb']))
+            records.append(rec)
+    print('Peak process memory: ' + str(peak_memory_mb()) + ' MB')
+    if(args.json is not None):
+        with open(args.json,'w') as bf:
+            json.dump({'records': records,'peak_memory_mb': peak_memory_mb()},bf,indent=2)
+    if(args.baseline is not None):
+        with open(args.baseline) as bf:
+            slower = compare(records,json.load(bf)['records'],args.tolerance)
+        for rec in slower:
+            print('Slower than baseline: ' + str(rec['stations']) + ' stations, ' + rec['stage'] + ', ' +
+                  str(rec['baseline_seconds']) + ' s -> ' + str(rec['seconds']) + ' s (x' +
+                  str(rec['ratio']) + ')')
+        if(len(slower) > 0):
+            return 1
+    return 0
+
+if(__name__ == '__main__'):
+    sys.exit(main())
@@ -0,0 +1,116 @@
+'''
+Command line entry point, e.g.
+
+    python -m nfdrs_trends --config nfdrs.json
+    python -m nfdrs_trends --date 2025-09-11 --time 0200 --dry-run
+    python -m nfdrs_trends --backfill 2025-06-01 2025-09-30 --out backfill
+    python -m nfdrs_trends --serve --config nfdrs.json
+    python -m nfdrs_trends --rebuild-percentiles 2005-01-01 2022-12-31 --out Percentiles.csv
+'''
+
+# Import libraries and modules
+import os, atexit, argparse, cProfile, logging
+from datetime import datetime
+from .config import load_config
+from .logs import setup_logging
+from .metrics import metrics
+from .fems import FEMSDownloadError
+from .backfill import backfill
+from .climatology import rebuild_percentiles
+from .daemon import serve
+from . import pipeline
+
+log = logging.getLogger('nfdrs_trends')
+
+def parse_args(argv=None):
+    '''
+    Parses the command line. Update date and time default to today and the current hour.
+    '''
+    parser = argparse.ArgumentParser(prog='nfdrs_trends',
+                                     description='Updates RAWS and PSA ERC and BI Percentiles and '
+                                                 'Trends tables using NFDRS data from FEMS.')
+    parser.add_argument('--date',default=datetime.today().strftime('%Y-%m-%d'),
+                        help="update date, 'YYYY-MM-DD' (default today)")
+    parser.add_argument('--time',default=datetime.today().strftime('%H') + '00',
+                        help="update time, 'HHMM' (default the current hour)")
+    parser.add_argument('--config',default=None,
+                        help='JSON file of settings overriding the defaults in nfdrs_trends.config')
+    parser.add_argument('--dry-run',action='store_true',
+                        help='compute results without updating the service')
+    parser.add_argument('--incremental',action='store_true',
+                        help='reuse FEMS records and results from the rolling store (see store_dir)')
+    parser.add_argument('--overlap',action='store_true',
+                        help='run the FEMS download, AGOL table loads and uploads concurrently '
+                             '(see overlap_stages)')
+    parser.add_argument('--backfill',nargs=2,metavar=('START','END'),default=None,
+                        help='rebuild results for every update date from START through END to a '
+                             'Parquet dataset instead of updating the service')
+    parser.add_argument('--rebuild-percentiles',nargs=2,metavar=('START','END'),default=None,
+                        help='rebuild the Percentiles table from the FEMS observations from START '
+                             'through END to a file instead of updating the service')
+    parser.add_argument('--out',default=None,
+                        help='backfill output directory (default wdir/backfill) or rebuilt Percentiles '
+                             'file, .csv or .parquet (default wdir/Percentiles_START_END.csv)')
+    parser.add_argument('--workers',type=int,default=None,
+                        help='backfill or rebuild worker processes (default one per CPU)')
+    parser.add_argument('--serve',action='store_true',
+                        help='keep running, updating on the refresh_minutes schedule (see config)')
+    parser.add_argument('--cycles',type=int,default=None,
+                        help='with --serve, stop after this many cycles (default run until stopped)')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    '''
+    Runs the update from the command line. Returns the exit status.
+    '''
+    args = parse_args(argv)
+    config = load_config(args.config)
+    if(args.incremental):
+        config['incremental'] = True
+    if(args.overlap):
+        config['overlap_stages'] = True
+    udate = args.date
+    utime = args.time
+    run_id = udate.replace('-','')
+    if(args.backfill is not None):
+        run_id = 'backfill_' + args.backfill[0].replace('-','') + '_' + args.backfill[1].replace('-','')
+    elif(args.rebuild_percentiles is not None):
+        run_id = ('percentiles_' + args.rebuild_percentiles[0].replace('-','') + '_' +
+                  args.rebuild_percentiles[1].replace('-',''))
+    elif(args.serve):
+        run_id = 'service_' + datetime.today().strftime('%Y%m%d')
+
+    # Start log files
+    log_base = os.path.join(config['wdir'],'NFDRS_log_' + run_id)
+    setup_logging(log_base + '.txt',config['log_level'],config['console_level'],
+                  log_base + '.jsonl' if config['log_json'] else None)
+
+    # Start run metrics, written next to the log file at exit (including aborted runs). The
+    # refresh service writes metrics for each cycle instead.
+    if(not args.serve):
+        metrics.reset(date=args.backfill or args.rebuild_percentiles or udate,time=utime)
+        atexit.register(metrics.write,os.path.join(config['wdir'],'NFDRS_metrics_' + run_id + '.json'))
+
+    # Optional - profile the run with cProfile by setting the NFDRS_PROFILE environment variable
+    if(os.environ.get('NFDRS_PROFILE')):
+        profiler = cProfile.Profile()
+        profiler.enable()
+        prof_path = os.path.join(config['wdir'],'NFDRS_profile_' + run_id + '.prof')
+        atexit.register(profiler.dump_stats,prof_path)
+        atexit.register(profiler.disable) # Registered last so it runs first
+
+    try:
+        if(args.serve):
+            serve(config,args.dry_run,args.cycles)
+        elif(args.backfill is not None):
+            backfill(config,args.backfill[0],args.backfill[1],utime,args.out,args.workers)
+        elif(args.rebuild_percentiles is not None):
+            rebuild_percentiles(config,args.rebuild_percentiles[0],args.rebuild_percentiles[1],args.out,
+                                args.workers)
+        else:
+            pipeline.run(config,udate,utime,args.dry_run)
+    except FEMSDownloadError:
+        log.error('Analysis and update aborted!')
+        return 1
+    log.info('Script complete!')
+    return 0
@@ -0,0 +1,228 @@
+'''
+Percentiles table rebuild: computes the historical percentile breakpoints of every station from
+its FEMS observation record, e.g. for the 2005-2022 climatology the table was built from:
+
+    python -m nfdrs_trends --rebuild-percentiles 2005-01-01 2022-12-31 --out Percentiles.csv
+
+Stations are split into batches that worker processes download from FEMS one window of
+window_days at a time. Each window is reduced to counts of every distinct daily maximum per
+station, fuel model and index before the next is requested, so memory holds one window per
+worker plus the counts. The counts give the exact empirical distribution, and each distinct value
+becomes one row of the table:
+
+    GreaterThanEqualTo = value, LessThan = next higher value,
+    Percentile = share of observed days at or below value
+
+so lookup_percentiles resolves a value to the share of historical days at or below it, values
+below the record to 0.01 and values at or above the record maximum to 100. Only observed ('O')
+records are used; days missing from FEMS are skipped (no gap filling). The table has the columns
+of the Percentiles service table, plus Fuel_Model if the indices setting has a fuel model other
+than Y.
+'''
+
+# Import libraries and modules
+import os, logging, pandas, numpy, requests
+from datetime import datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor
+from .metrics import metrics
+from . import agol
+from .indices import FEMS_INDEX_FIELDS, DEFAULT_INDICES, lookup_key, fuel_models
+from .fems import fetch_fems_batch, fems_fields
+from .percentiles import TABLE_FUEL_MODEL
+from .workers import shared, init_worker
+
+log = logging.getLogger(__name__)
+
+def date_windows(sdate, edate, window_days=366):
+    '''
+    Splits sdate through edate ('YYYY-MM-DD') into (start, end) windows of up to window_days days.
+    '''
+    start = datetime.strptime(sdate,'%Y-%m-%d')
+    end = datetime.strptime(edate,'%Y-%m-%d')
+    if(end < start):
+        raise ValueError('Climatology end date ' + edate + ' is before start date ' + sdate)
+    windows = []
+    while(start <= end):
+        stop = min(start + timedelta(days=window_days - 1),end)
+        windows.append((start.strftime('%Y-%m-%d'),stop.strftime('%Y-%m-%d')))
+        start = stop + timedelta(days=1)
+    return windows
+
+def value_counts(fd_df, indices=DEFAULT_INDICES):
+    '''
+    Returns the number of observed days at each distinct value per station for every fuel model
+    and index pair in indices (nfdrMinMax records with the FEMS field names), keyed by lookup_key.
+    '''
+    obs = fd_df.loc[fd_df['nfdr_type'] == 'O']
+    counts = {}
+    for spec in indices:
+        rows = obs.loc[obs['fuel_model'] == spec['fuel_model']]
+        vals = pandas.DataFrame({'Station_ID': rows['station_id'].to_numpy(),
+                                 'value': pandas.to_numeric(rows[FEMS_INDEX_FIELDS[spec['component']]],
+                                                            errors='coerce').to_numpy(dtype='float64')})
+        counts[lookup_key(spec)] = vals.dropna().groupby(['Station_ID','value']).size()
+    return counts
+
+def merge_counts(parts):
+    '''
+    Adds up value counts (from value_counts) for the same station and value.
+    '''
+    parts = [part for part in parts if len(part) > 0]
+    if(len(parts) == 0):
+        return pandas.Series(dtype='int64',index=pandas.MultiIndex.from_tuples([],names=['Station_ID','value']))
+    return pandas.concat(parts).groupby(level=[0,1]).sum()
+
+def station_batch_counts(station_ids):
+    '''
+    Downloads the record of one batch of stations window by window and returns the value counts
+    of every pair, keyed by lookup_key, and the number of records read.
+    '''
+    indices = shared['indices']
+    sids = ','.join([str(sid) for sid in station_ids])
+    fields = fems_fields(indices)
+    session = requests.Session()
+    counts = {lookup_key(spec): [] for spec in indices}
+    n_records = 0
+    try:
+        for sdate, edate in shared['windows']:
+            buffers = fetch_fems_batch(session,shared['url'],sdate,edate,sids,shared['per_page'],
+                                       indices=indices)[0]
+            fd_df = pandas.DataFrame(buffers,columns=fields)
+            del buffers
+            n_records = n_records + fd_df.shape[0]
+            for key, part in value_counts(fd_df,indices).items():
+                counts[key].append(part)
+            counts = {key: [merge_counts(parts)] for key, parts in counts.items()} # Keep one part
+    finally:
+        session.close()
+    return {key: parts[0] for key, parts in counts.items()}, n_records
+
+def percentile_breakpoints(counts, min_days=365):
+    '''
+    Builds the GreaterThanEqualTo/LessThan/Percentile rows of every station in counts (a value
+    count series indexed by station and value) with at least min_days observed days. A station
+    with a single distinct value gets one row from that value to itself, so it resolves to 0.01
+    below and 100 at or above it.
+    '''
+    counts = counts.sort_index()
+    sids = counts.index.get_level_values(0).to_numpy()
+    vals = counts.index.get_level_values(1).to_numpy(dtype='float64')
+    n = counts.to_numpy(dtype='float64')
+    if(len(n) == 0):
+        return pandas.DataFrame(columns=['Station_ID','GreaterThanEqualTo','LessThan','Percentile'])
+    starts = numpy.flatnonzero(numpy.r_[True,sids[1:] != sids[:-1]])
+    totals = numpy.add.reduceat(n,starts)
+    station_total = numpy.repeat(totals,numpy.diff(numpy.append(starts,len(n))))
+
+    # Running share of each station's days at or below each value
+    cum = numpy.cumsum(n)
+    cum = cum - numpy.repeat(numpy.append(0,cum[starts[1:] - 1]),numpy.diff(numpy.append(starts,len(n))))
+    percentile = numpy.round(cum / station_total * 100,2)
+
+    # Each value's row runs to the station's next value; the maximum closes the table
+    last = numpy.append(sids[1:] != sids[:-1],True)
+    single = last & numpy.r_[True,sids[1:] != sids[:-1]]
+    keep = (~last | single) & (station_total >= min_days)
+    lt = numpy.where(last,vals,numpy.append(vals[1:],numpy.nan))
+    return pandas.DataFrame({'Station_ID': sids[keep],
+                             'GreaterThanEqualTo': vals[keep],
+                             'LessThan': lt[keep],
+                             'Percentile': numpy.where(single,100.0,percentile)[keep]})
+
+def percentile_table(counts, indices=DEFAULT_INDICES, min_days=365):
+    '''
+    Returns the Percentiles table for the value counts of every pair in indices (keyed by
+    lookup_key), with a Fuel_Model field if indices has a fuel model other than Y (the fuel
+    model of a table without one, see percentiles.TABLE_FUEL_MODEL).
+    '''
+    with_models = fuel_models(indices) != [TABLE_FUEL_MODEL]
+    parts = []
+    for spec in indices:
+        rows = percentile_breakpoints(counts[lookup_key(spec)],min_days)
+        rows.insert(1,'Component',spec['component'])
+        if(with_models):
+            rows.insert(1,'Fuel_Model',spec['fuel_model'])
+        parts.append(rows)
+    per_df = pandas.concat(parts,ignore_index=True)
+    per_df = per_df.drop_duplicates([col for col in ['Station_ID','Fuel_Model','Component','GreaterThanEqualTo']
+                                      if col in per_df.columns]) # Pairs sharing a fuel model and index
+    per_df.insert(0,'OBJECTID',numpy.arange(1,per_df.shape[0] + 1))
+    return per_df.reset_index(drop=True)
+
+def write_table(per_df, path):
+    '''
+    Writes the table as Parquet if path ends in .parquet and as CSV otherwise.
+    '''
+    os.makedirs(os.path.dirname(os.path.abspath(path)),exist_ok=True)
+    if(path.endswith('.parquet')):
+        per_df.to_parquet(path + '.tmp',index=False)
+    else:
+        per_df.to_csv(path + '.tmp',index=False)
+    os.replace(path + '.tmp',path)
+
+def rebuild_percentiles(config, sdate, edate, out_path=None, workers=None, station_ids=None,
+                        batch_size=50, window_days=366, min_days=365):
+    '''
+    Rebuilds the Percentiles table from the FEMS observations from sdate through edate for the
+    fuel model and index pairs in the indices setting and writes it to out_path (default
+    wdir/Percentiles_START_END.csv). Stations default to those in the PSA_RAWS_Associations table
+    (or the raws_locations file with spatial PSA membership). workers sets the number of
+    processes (default one per CPU). Stations with fewer than min_days observed days are left
+    out. Returns out_path.
+    '''
+    windows = date_windows(sdate,edate,window_days)
+    if(out_path is None):
+        out_path = os.path.join(config['wdir'],'Percentiles_' + sdate.replace('-','') + '_' +
+                                edate.replace('-','') + '.csv')
+
+    #################################################################################################
+    ### Get the stations to rebuild
+    #################################################################################################
+    metrics.start_stage('Get the stations to rebuild')
+    log.info('Get the stations to rebuild')
+    if(station_ids is None):
+        if(config['psa_membership'] == 'spatial'):
+            from .spatial import read_geojson
+            station_ids = read_geojson(config['raws_locations'],'Station_ID')[0].tolist()
+        else:
+            service, tables = agol.connect(config)
+            pra_df = agol.load_associations(service,tables,config['cache_dir'])
+            station_ids = pra_df['Station_ID'].tolist()
+    station_ids = sorted(set(station_ids))
+    batches = [station_ids[i:i + batch_size] for i in range(0,len(station_ids),batch_size)]
+    log.info('.' + str(len(station_ids)) + ' stations in ' + str(len(batches)) + ' batches, ' +
+             str(len(windows)) + ' windows of up to ' + str(window_days) + ' days')
+
+    #################################################################################################
+    ### Count historical FEMS values by station
+    #################################################################################################
+    metrics.start_stage('Count historical FEMS values by station')
+    log.info('Count historical FEMS values by station, ' + sdate + ' to ' + edate)
+    counts = {lookup_key(spec): [] for spec in config['indices']}
+    n_records = 0
+    with ProcessPoolExecutor(max_workers=workers,initializer=init_worker,
+                             initargs=({'url': config['fems_api'],'per_page': config['fems_per_page'],
+                                        'windows': windows,'indices': config['indices']},)) as pool:
+        for i, (batch_counts, batch_records) in enumerate(pool.map(station_batch_counts,batches)):
+            for key, part in batch_counts.items():
+                counts[key].append(part)
+            n_records = n_records + batch_records
+            log.info('.Batch ' + str(i + 1) + ' of ' + str(len(batches)) + ': ' + str(batch_records) +
+                     ' records')
+    counts = {key: merge_counts(parts) for key, parts in counts.items()}
+    log.info('.Read ' + str(n_records) + ' records')
+
+    #################################################################################################
+    ### Build and write the Percentiles table
+    #################################################################################################
+    metrics.start_stage('Build and write the Percentiles table')
+    log.info('Build and write the Percentiles table')
+    per_df = percentile_table(counts,config['indices'],min_days)
+    write_table(per_df,out_path)
+    n_stations = per_df['Station_ID'].nunique()
+    log.info('.Wrote ' + str(per_df.shape[0]) + ' breakpoints for ' + str(n_stations) + ' stations to ' +
+             out_path)
+    if(n_stations < len(station_ids)):
+        log.warning('..' + str(len(station_ids) - n_stations) + ' stations had fewer than ' +
+                    str(min_days) + ' observed days and were left out')
+    return out_path
@@ -0,0 +1,151 @@
+'''
+Run settings. The defaults below are used unless overridden by a JSON config file passed to the
+command line with --config. AGOL credentials and the service item can also be set with the
+NFDRS_AGOL_USERNAME, NFDRS_AGOL_PASSWORD and NFDRS_ITEMID environment variables.
+'''
+
+# Import libraries and modules
+import copy, json, os
+from .indices import DEFAULT_INDICES, check_indices
+
+DEFAULTS = {
+    # Working directory for log, metrics and cache files
+    'wdir': '.',
+
+    # ArcGIS Online Portal URL and service info
+    'agol_portalurl': 'https://www.arcgis.com',
+    'itemid': 'XXXXXX',
+    'agol_username': 'XXXXXX',
+    'agol_password': 'XXXXXX',
+
+    # FeatureServer URL to use directly instead of looking up itemid through the portal, e.g. the
+    # local mock server (python -m nfdrs_trends.mock_server). Leave null for AGOL.
+    'feature_service_url': None,
+
+    # Local cache of the static Percentiles and PSA_RAWS_Associations tables, relative to wdir
+    # Set to null to download both tables on every run
+    'cache_dir': 'cache',
+
+    # FEMS download settings
+    # Set fems_per_page to null to request all records in a single un-paged query
+    # Set fems_batch_size to null to request every FEMS station in one query instead of only the
+    # stations in the PSA_RAWS_Associations table
+    'fems_api': 'https://fems.fs2c.usda.gov/api/climatology/graphql',
+    'fems_per_page': 10000,
+    'fems_workers': 4,
+    'fems_batch_size': 250,
+
+    # Upload settings
+    # With upload_changed_only, only rows whose values differ from the service are sent. Every
+    # field counts, so each run's update_date/update_time mark every row as changed and the diff
+    # only skips rows on reruns with the same date and time. Fields in diff_ignore_fields (e.g.
+    # ['update_date','update_time']) are still uploaded with changed rows but do not by themselves
+    # make a row count as changed, so they record when a row's values last changed instead of
+    # when it was last checked.
+    'upload_changed_only': False,
+    'diff_ignore_fields': [],
+    'upload_chunk_size': 500,
+    'upload_workers': 4,
+    'upload_attempts': 5,
+
+    # Overlap independent network calls (see pipeline.Pipeline.cycle_overlapped): the FEMS
+    # download, percentile lookups and target table queries run at the same time, and the RAWS
+    # upload runs while the PSA means are computed
+    'overlap_stages': False,
+
+    # Incremental updates keep the last store_days days of FEMS records and the previous RAWS
+    # results in store_dir (relative to wdir), download only new observation days and forecasts and
+    # only recompute stations whose inputs changed
+    'incremental': False,
+    'store_dir': 'store',
+    'store_days': 10,
+
+    # Refresh service (--serve) schedule: a cycle every refresh_minutes minutes from midnight,
+    # only in the hours of the day listed in refresh_hours (e.g. [6,7,...,20]) unless null.
+    # The service keeps the reference and target tables in memory and reloads them after
+    # reference_refresh_hours hours.
+    'refresh_minutes': 60,
+    'refresh_hours': None,
+    'reference_refresh_hours': 24,
+
+    # Archive of each run's FEMS records and RAWS and PSA results as compressed Parquet snapshots
+    # partitioned by run date and time under archive_dir (relative to wdir, see archive). Set to
+    # null to skip.
+    'archive_dir': None,
+    'archive_compression': 'zstd',
+
+    # Station-to-PSA membership: 'table' uses the PSA_RAWS_Associations table, 'spatial' derives
+    # it from the stations in the raws_locations GeoJSON points (Station_ID and Station_Name
+    # properties) that fall inside the psa_boundaries GeoJSON polygons (PSANationalCode property),
+    # both relative to wdir (see spatial). psa_weighting weights the station values in the PSA
+    # means by 'distance' (inverse distance to the PSA centroid) or 'area' (Thiessen polygon area
+    # within the PSA) in spatial mode; null averages them equally.
+    'psa_membership': 'table',
+    'raws_locations': None,
+    'psa_boundaries': None,
+    'psa_weighting': None,
+
+    # Fuel model and index pairs to analyze, all fetched from FEMS in the same queries. Each pair
+    # writes its field, field_percentile, field_trend, field_fcast, field_fcast_percentile and
+    # field_fcast_trend to the RAWS table and avg_ + each of these to the PSA table, so the
+    # service tables need those fields. component is one of ERC, BI, SC or IC.
+    'indices': DEFAULT_INDICES,
+
+    # Difference in an index between start and end values that counts as an increase or decrease
+    'trend_threshold': 3,
+
+    # Logging settings
+    # Set console_level to 'WARNING' for a quiet run and log_level to 'DEBUG' to add per-station
+    # and per-PSA detail records to the log files. log_json also writes a JSON-lines copy.
+    'log_level': 'INFO',
+    'console_level': 'INFO',
+    'log_json': True,
+}
+
+# Environment variables that override settings
+ENV_SETTINGS = {'agol_username': 'NFDRS_AGOL_USERNAME',
+                'agol_password': 'NFDRS_AGOL_PASSWORD',
+                'itemid': 'NFDRS_ITEMID'}
+
+def check_membership(config):
+    '''
+    Raises ValueError if the PSA membership settings are invalid or spatial mode is missing its
+    input files.
+    '''
+    if(config['psa_membership'] not in ['table','spatial']):
+        raise ValueError('Unsupported psa_membership ' + str(config['psa_membership']) +
+                         ', expected table or spatial')
+    if(config['psa_weighting'] not in [None,'distance','area']):
+        raise ValueError('Unsupported psa_weighting ' + str(config['psa_weighting']) +
+                         ', expected null, distance or area')
+    if(config['psa_membership'] == 'spatial'):
+        missing = [key for key in ['raws_locations','psa_boundaries'] if not config[key]]
+        if(len(missing) > 0):
+            raise ValueError('Spatial PSA membership needs ' + ' and '.join(missing))
+    elif(config['psa_weighting'] is not None):
+        raise ValueError('psa_weighting needs psa_membership spatial')
+
+def load_config(path=None):
+    '''
+    Returns the run settings: the defaults, updated from the JSON file at path (if given) and
+    then from the environment. Relative cache_dir, store_dir, archive_dir, raws_locations and
+    psa_boundaries are resolved against wdir.
+    Raises ValueError for unknown settings or an invalid indices or PSA membership setting.
+    '''
+    config = copy.deepcopy(DEFAULTS)
+    if(path is not None):
+        with open(path) as cf:
+            user = json.load(cf)
+        unknown = sorted(set(user) - set(DEFAULTS))
+        if(len(unknown) > 0):
+            raise ValueError('Unknown config setting(s): ' + ', '.join(unknown))
+        config.update(user)
+    for key, env in ENV_SETTINGS.items():
+        if(os.environ.get(env)):
+            config[key] = os.environ[env]
+    check_indices(config['indices'])
+    check_membership(config)
+    for key in ['cache_dir','store_dir','archive_dir','raws_locations','psa_boundaries']:
+        if(config[key] is not None):
+            config[key] = os.path.join(config['wdir'],config[key])
+    return config
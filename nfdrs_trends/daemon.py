@@ -0,0 +1,70 @@
+'''
+Refresh service: a long-running process that re-runs the update on a schedule, e.g. hourly during
+fire season when forecasts update, e.g.
+
+    python -m nfdrs_trends --serve --config nfdrs.json
+
+The service connection, reference tables, last published values and FEMS records stay in memory
+between cycles (see pipeline.Pipeline), so each cycle only fetches, computes and publishes what
+changed. A failed cycle is logged and the next one reconnects from scratch.
+'''
+
+# Import libraries and modules
+import os, logging
+from datetime import datetime, timedelta
+from time import sleep
+from .metrics import metrics
+from .fems import FEMSDownloadError
+from .pipeline import Pipeline
+
+log = logging.getLogger(__name__)
+
+def next_run(now, minutes=60, hours=None):
+    '''
+    Returns the next scheduled time after now: every minutes minutes from midnight, only in the
+    listed hours of the day if hours is given.
+    '''
+    day = now.replace(hour=0,minute=0,second=0,microsecond=0)
+    slot = day + timedelta(minutes=minutes * ((now - day) // timedelta(minutes=minutes) + 1))
+    while((hours is not None) and (slot.hour not in hours)):
+        slot = slot + timedelta(minutes=minutes)
+    return slot
+
+def serve(config, dry_run=False, cycles=None):
+    '''
+    Runs update cycles on the refresh_minutes / refresh_hours schedule until interrupted (or for
+    the given number of cycles). The first cycle runs right away if the current hour is allowed.
+    Metrics for each cycle are written to wdir as NFDRS_metrics_YYYYMMDD_HHMM.json.
+    '''
+    minutes = config['refresh_minutes']
+    hours = config['refresh_hours']
+    pipe = Pipeline(config,keep_state=True)
+    log.info('Refresh service started, every ' + str(minutes) + ' minutes' +
+             ('' if hours is None else ' in hours ' + ','.join([str(hour) for hour in hours])))
+    slot = datetime.now().replace(second=0,microsecond=0)
+    if((hours is not None) and (slot.hour not in hours)):
+        slot = next_run(slot,minutes,hours)
+    n_cycles = 0
+    try:
+        while((cycles is None) or (n_cycles < cycles)):
+            wait = (slot - datetime.now()).total_seconds()
+            if(wait > 0):
+                log.info('Next cycle at ' + slot.strftime('%Y-%m-%d %H:%M'))
+                sleep(wait)
+            udate = slot.strftime('%Y-%m-%d')
+            utime = slot.strftime('%H%M')
+            metrics.reset(date=udate,time=utime)
+            try:
+                pipe.cycle(udate,utime,dry_run)
+                log.info('Cycle complete!')
+            except FEMSDownloadError:
+                log.error('Cycle aborted, FEMS data not available')
+            except Exception:
+                log.exception('Cycle failed, reconnecting next cycle')
+                pipe.reset()
+            metrics.write(os.path.join(config['wdir'],'NFDRS_metrics_' + udate.replace('-','') + '_' +
+                                       utime + '.json'))
+            n_cycles = n_cycles + 1
+            slot = next_run(max(slot,datetime.now()),minutes,hours) # Skip slots missed by a long cycle
+    except KeyboardInterrupt:
+        log.info('Refresh service stopped')
@@ -0,0 +1,255 @@
+'''
+Downloads NFDRS observations and forecasts from the FEMS climatology GraphQL API.
+'''
+
+# Import libraries and modules
+import logging, pandas, requests
+from datetime import datetime, timedelta
+from time import sleep
+from concurrent.futures import ThreadPoolExecutor
+from .metrics import metrics
+from .indices import FEMS_INDEX_FIELDS, DEFAULT_INDICES, fuel_models, components
+from .schema import compact_fems
+try:
+    import ijson # Optional - streams FEMS pages into column buffers without loading the full body
+except ImportError:
+    ijson = None
+
+log = logging.getLogger(__name__)
+
+# Record fields requested from the nfdrMinMax query, before the index fields
+FEMS_BASE_FIELDS = ['station_id','summary_date','nfdr_type','fuel_model']
+
+# Short names used for the FEMS columns in the analysis (index fields are named by component)
+FEMS_COLUMNS = dict([('summary_date','date')] + [(field,comp) for comp, field in FEMS_INDEX_FIELDS.items()])
+
+# Dtypes of the record keys, set explicitly so a pull without records keeps string dates
+FEMS_KEY_DTYPES = {'station_id': 'int64','summary_date': 'str'}
+
+def fems_fields(indices=DEFAULT_INDICES):
+    '''
+    Returns the nfdrMinMax fields to request for the fuel model and index pairs in indices.
+    '''
+    return FEMS_BASE_FIELDS + [FEMS_INDEX_FIELDS[comp] for comp in components(indices)]
+
+# Fields requested for the default fuel model Y ERC and BI
+FEMS_FIELDS = fems_fields()
+
+class FEMSDownloadError(RuntimeError):
+    '''
+    Raised when FEMS data could not be downloaded after every attempt.
+    '''
+
+def fems_dates(udate):
+    '''
+    Returns the observation and forecast start and end dates for an update date ('YYYY-MM-DD').
+    Updates are done in early AM Mountain Time, so observations end yesterday and the forecast
+    starts today.
+    '''
+    day = datetime.strptime(udate,'%Y-%m-%d')
+    return {'o_sdate': (day - timedelta(days=3)).strftime('%Y-%m-%d'),
+            'o_edate': (day - timedelta(days=1)).strftime('%Y-%m-%d'),
+            'f_sdate': udate,
+            'f_edate': (day + timedelta(days=2)).strftime('%Y-%m-%d')}
+
+def fems_query(sdate, edate, station_ids='', page=None, per_page=None, models='Y', fields=FEMS_FIELDS):
+    '''
+    Builds the nfdrMinMax GraphQL query for a date window, comma-separated station list (empty
+    for all stations) and comma-separated fuel models, optionally limited to one page of results.
+    '''
+    paging = ''
+    if(page is not None):
+        paging = '    page: ' + str(page) + '\n    per_page: ' + str(per_page) + '\n'
+    return ('query NfdrMinMax {\n'
+            '  nfdrMinMax(\n'
+            '    startDate: "' + sdate + '",\n'
+            '    endDate: "' + edate + '",\n'
+            '    fuelModels: "' + models + '"\n'
+            '    stationIds: "' + station_ids + '"\n' +
+            paging +
+            '  ) {\n'
+            '    _metadata {\n'
+            '      page\n'
+            '      per_page\n'
+            '      total_count\n'
+            '      page_count\n'
+            '    }\n'
+            '    data {\n' +
+            ''.join(['      ' + field + '\n' for field in fields]) +
+            '    }\n'
+            '  }\n'
+            '}')
+
+def parse_fems_stream(stream, buffers):
+    '''
+    Incrementally parses one nfdrMinMax response with ijson, appending each record's fields to
+    the column buffers. Returns the _metadata block.
+    '''
+    meta = {}
+    row = None
+    for prefix, event, value in ijson.parse(stream,use_float=True):
+        if(prefix == 'errors'):
+            raise RuntimeError('FEMS query returned errors')
+        if(prefix == 'data.nfdrMinMax.data.item'):
+            if(event == 'start_map'):
+                row = {}
+            elif(event == 'end_map'):
+                for field, buffer in buffers.items():
+                    buffer.append(row.get(field))
+                row = None
+        elif((row is not None) & (event not in ('map_key','start_map','end_map',
+                                                'start_array','end_array'))):
+            row[prefix.rsplit('.',1)[1]] = value
+        elif(prefix.startswith('data.nfdrMinMax._metadata.') & (event == 'number')):
+            meta[prefix.rsplit('.',1)[1]] = value
+    return meta
+
+def fetch_fems_page(session, url, query, fields=FEMS_FIELDS):
+    '''
+    Posts one nfdrMinMax query and returns its _metadata block and column buffers of records.
+    '''
+    buffers = {field: [] for field in fields}
+    response = session.post(url,json={'query': query},stream=(ijson is not None))
+    response.raise_for_status()
+    if(ijson is not None):
+        response.raw.decode_content = True
+        meta = parse_fems_stream(response.raw,buffers)
+        metrics.count_http('FEMS',response.raw.tell())
+    else:
+        metrics.count_http('FEMS',len(response.content))
+        data = response.json()
+        if(data.get('errors')):
+            raise RuntimeError('FEMS query returned errors')
+        meta = data['data']['nfdrMinMax']['_metadata'] or {}
+        for rec in data['data']['nfdrMinMax']['data']:
+            for field in fields:
+                buffers[field].append(rec.get(field))
+        del data
+    response.close()
+    return meta, buffers
+
+def fetch_fems_query(session, url, sdate, edate, station_ids='', per_page=None, pool=None,
+                     indices=DEFAULT_INDICES):
+    '''
+    Downloads every page of one nfdrMinMax query for the fuel models and index fields of the
+    pairs in indices. When per_page is set, the first page is requested to learn page_count and
+    the remaining pages are pulled through the thread pool (or in turn if no pool is given).
+    Raises an error if fewer records arrive than FEMS reports in total_count.
+    '''
+    models = ','.join(fuel_models(indices))
+    fields = fems_fields(indices)
+    if(per_page is None):
+        meta, buffers = fetch_fems_page(session,url,fems_query(sdate,edate,station_ids,models=models,
+                                                               fields=fields),fields)
+        page_count = 1
+    else:
+        meta, buffers = fetch_fems_page(session,url,fems_query(sdate,edate,station_ids,1,per_page,
+                                                               models,fields),fields)
+        page_count = int(meta.get('page_count') or 1)
+    queries = [fems_query(sdate,edate,station_ids,page,per_page,models,fields)
+               for page in range(2,page_count + 1)]
+    if(pool is not None):
+        pages = pool.map(lambda query: fetch_fems_page(session,url,query,fields)[1],queries)
+    else:
+        pages = (fetch_fems_page(session,url,query,fields)[1] for query in queries)
+    for page_buffers in pages: # Keep page order
+        for field in fields:
+            buffers[field].extend(page_buffers[field])
+        del page_buffers
+    total_count = meta.get('total_count')
+    if((per_page is not None) & (total_count is not None)):
+        if(len(buffers['station_id']) < int(total_count)):
+            raise RuntimeError('FEMS returned ' + str(len(buffers['station_id'])) + ' of ' +
+                               str(total_count) + ' records')
+    return buffers, page_count, total_count
+
+def fetch_fems_batch(session, url, sdate, edate, station_ids, per_page=None, attempts=3,
+                     indices=DEFAULT_INDICES):
+    '''
+    Downloads one batch of stations, retrying the batch on its own before giving up.
+    '''
+    for attempt in range(0,attempts):
+        try:
+            return fetch_fems_query(session,url,sdate,edate,station_ids,per_page,indices=indices)
+        except Exception:
+            if(attempt == attempts - 1):
+                raise
+            metrics.count_retry('FEMS batch')
+            sleep(5 * (attempt + 1)) # Short wait before retrying the batch
+
+def fetch_fems(url, sdate, edate, station_ids=None, batch_size=None, per_page=None, workers=4,
+               indices=DEFAULT_INDICES):
+    '''
+    Downloads nfdrMinMax records for the date window over a pooled session, for every fuel model
+    and index in indices in the same queries. If station_ids and batch_size are given, only those
+    stations are requested, split into batches that are fetched in parallel and merged.
+    Otherwise the listed stations (or all FEMS stations if None) are requested in one query with
+    its pages fetched in parallel.
+    '''
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1,pool_maxsize=workers)
+    session.mount('https://',adapter)
+    session.mount('http://',adapter)
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            if((station_ids is None) | (batch_size is None)):
+                sids = '' if station_ids is None else ','.join([str(sid) for sid in station_ids])
+                results = [fetch_fems_query(session,url,sdate,edate,sids,per_page,pool,indices)]
+            else:
+                batches = [','.join([str(sid) for sid in station_ids[i:i + batch_size]])
+                           for i in range(0,len(station_ids),batch_size)]
+                futures = [pool.submit(fetch_fems_batch,session,url,sdate,edate,batch,per_page,
+                                       indices=indices)
+                           for batch in batches]
+                results = [future.result() for future in futures]
+    finally:
+        session.close()
+
+    # Merge batches into one table
+    fields = fems_fields(indices)
+    buffers = {field: [] for field in fields}
+    for batch_buffers, page_count, total_count in results:
+        for field in fields:
+            buffers[field].extend(batch_buffers[field])
+    fd_df = pandas.DataFrame(buffers,columns=fields).astype(FEMS_KEY_DTYPES) # Also when no records
+    totals = [result[2] for result in results]
+    return fd_df, {'batch_count': len(results),
+                   'page_count': sum([result[1] for result in results]),
+                   'total_count': None if None in totals else sum([int(t) for t in totals])}
+
+def fetch_fems_data(config, sdate, edate, station_ids=None, attempts=5, wait=30):
+    '''
+    Downloads the FEMS records for the date window with the run's FEMS settings, re-trying the
+    whole download up to attempts times, for the fuel model and index pairs in the indices
+    setting. Returns the records with the summary date and index columns renamed to date and the
+    index name (e.g. ERC), compacted to the working dtypes (see schema.compact_fems). Raises
+    FEMSDownloadError if every attempt fails.
+    '''
+    if(config['fems_batch_size'] is None):
+        station_ids = None # Request every FEMS station in one query
+    elif(station_ids is not None):
+        station_ids = sorted(set(station_ids))
+    for attempt in range(0,attempts):
+        try:
+            with metrics.timed('FEMS fetch'):
+                fd_df, fems_meta = fetch_fems(config['fems_api'],sdate,edate,station_ids,
+                                              config['fems_batch_size'],config['fems_per_page'],
+                                              config['fems_workers'],config['indices'])
+            break
+        except Exception:
+            if(attempt == attempts - 1):
+                log.error('..FEMS data failed to download after ' + str(attempts) + ' attempts')
+                raise FEMSDownloadError('FEMS data failed to download after ' + str(attempts) +
+                                        ' attempts')
+            log.warning('..Download failed, re-trying')
+            metrics.count_retry('FEMS download')
+            sleep(wait) # Wait before trying again
+    fd_df = compact_fems(fd_df.rename(columns=FEMS_COLUMNS))
+
+    log.info('.Downloaded ' + str(fd_df.shape[0]) + ' records in ' + str(fems_meta['batch_count']) +
+             ' station batch(es) and ' + str(fems_meta['page_count']) + ' page(s)')
+    if((fems_meta['total_count'] is not None) & (config['fems_per_page'] is None)):
+        if(fd_df.shape[0] < int(fems_meta['total_count'])):
+            log.warning('..Downloaded fewer records than the ' + str(fems_meta['total_count']) +
+                        ' reported by FEMS')
+    return fd_df
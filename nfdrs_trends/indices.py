@@ -0,0 +1,69 @@
+'''
+Fuel model and index pairs analyzed by a run. Each pair is a dict in the indices setting, e.g.
+
+    {'fuel_model': 'Y', 'component': 'ERC', 'field': 'erc'}
+
+and gets its own result fields in the RAWS table (field, field_percentile, field_trend,
+field_fcast, field_fcast_percentile, field_fcast_trend) and the PSA table (avg_ + each of these).
+'''
+
+# nfdrMinMax fields holding the daily maximum of each supported index
+FEMS_INDEX_FIELDS = {'ERC': 'energy_release_component_max',
+                     'BI': 'burning_index_max',
+                     'SC': 'spread_component_max',
+                     'IC': 'ignition_component_max'}
+
+# Fuel model Y ERC and BI, the fields of the original RAWS and PSA tables
+DEFAULT_INDICES = [{'fuel_model': 'Y','component': 'ERC','field': 'erc'},
+                   {'fuel_model': 'Y','component': 'BI','field': 'bi'}]
+
+# Result field suffixes for each pair, in table order
+RESULT_SUFFIXES = ['','_percentile','_trend','_fcast','_fcast_percentile','_fcast_trend']
+
+def check_indices(indices):
+    '''
+    Raises ValueError if the indices setting names an unsupported component, leaves out a key or
+    repeats a pair or result field.
+    '''
+    for spec in indices:
+        missing = [key for key in ['fuel_model','component','field'] if not spec.get(key)]
+        if(len(missing) > 0):
+            raise ValueError('Index setting ' + str(spec) + ' is missing ' + ', '.join(missing))
+        if(spec['component'] not in FEMS_INDEX_FIELDS):
+            raise ValueError('Unsupported index ' + str(spec['component']) + ', expected one of ' +
+                             ', '.join(FEMS_INDEX_FIELDS))
+    if(len(set([lookup_key(spec) for spec in indices])) < len(indices)):
+        raise ValueError('Fuel model and index pairs are repeated in the indices setting')
+    if(len(set([spec_key(spec) for spec in indices])) < len(indices)):
+        raise ValueError('Result fields are repeated in the indices setting')
+
+def spec_key(spec):
+    '''
+    Returns the prefix of a pair's per-station and per-PSA analysis columns, e.g. ERC_obs_per.
+    '''
+    return spec['field'].upper()
+
+def lookup_key(spec):
+    '''
+    Returns the key of a pair's percentile lookup, e.g. Y_ERC.
+    '''
+    return spec['fuel_model'] + '_' + spec['component']
+
+def fuel_models(indices):
+    '''
+    Returns the fuel models to request from FEMS, in setting order.
+    '''
+    return list(dict.fromkeys([spec['fuel_model'] for spec in indices]))
+
+def components(indices):
+    '''
+    Returns the index components to request from FEMS, in setting order.
+    '''
+    return list(dict.fromkeys([spec['component'] for spec in indices]))
+
+def result_fields(indices=DEFAULT_INDICES):
+    '''
+    Returns the RAWS_Percentiles_Trends result fields for the pairs (PSA_Percentiles_Trends uses
+    avg_ + field).
+    '''
+    return [spec['field'] + suffix for spec in indices for suffix in RESULT_SUFFIXES]
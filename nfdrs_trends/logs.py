@@ -0,0 +1,63 @@
+'''
+Logging for a run: leveled messages to the console, a text log file and an optional JSON-lines
+log file, written by a background thread.
+'''
+
+# Import libraries and modules
+import sys, json, queue, atexit, logging, pandas
+import logging.handlers
+
+class JsonFormatter(logging.Formatter):
+    '''
+    Formats log records as JSON lines, adding any fields passed with extra={'data': {...}}.
+    '''
+    def format(self, record):
+        rec = {'time': self.formatTime(record,'%Y-%m-%dT%H:%M:%S'),
+               'level': record.levelname,
+               'message': record.getMessage()}
+        for key, value in getattr(record,'data',{}).items():
+            if(hasattr(value,'item')):
+                value = value.item() # numpy scalars
+            try:
+                if(pandas.isna(value)):
+                    value = None
+            except (TypeError, ValueError):
+                pass
+            rec[key] = value
+        return json.dumps(rec,default=str)
+
+def setup_logging(log_path, level='INFO', console_level='INFO', json_path=None):
+    '''
+    Starts the nfdrs_trends logger. Records are queued and written to the console, the text log
+    file and the optional JSON-lines file by a background thread, so logging does not block the
+    run. The files are flushed on every record and the queue is drained at exit, including after
+    a crash.
+    '''
+    log = logging.getLogger('nfdrs_trends')
+    console = logging.StreamHandler(sys.stdout)
+    console.setLevel(console_level)
+    console.setFormatter(logging.Formatter('%(message)s'))
+    text_file = logging.FileHandler(log_path,'w')
+    text_file.setLevel(level)
+    text_file.setFormatter(logging.Formatter('%(asctime)s %(levelname)-8s %(message)s',
+                                             '%Y-%m-%d %H:%M:%S'))
+    handlers = [console,text_file]
+    if(json_path is not None):
+        json_file = logging.FileHandler(json_path,'w')
+        json_file.setLevel(level)
+        json_file.setFormatter(JsonFormatter())
+        handlers.append(json_file)
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue,*handlers,respect_handler_level=True)
+    log.handlers = [logging.handlers.QueueHandler(log_queue)]
+    log.setLevel(min(logging.getLevelName(level),logging.getLevelName(console_level)))
+    log.propagate = False
+    listener.start()
+    atexit.register(listener.stop)
+
+    # Record uncaught errors before the interpreter exits
+    def log_exception(exc_type, exc_value, exc_tb):
+        log.critical('Unhandled error, analysis and update aborted!',
+                     exc_info=(exc_type,exc_value,exc_tb))
+    sys.excepthook = log_exception
+    return listener
@@ -0,0 +1,96 @@
+'''
+Per-run instrumentation: section timings, HTTP request counts and bytes, retries and peak
+memory. Stages record into the shared metrics object, which the command line writes as JSON
+next to the log file.
+'''
+
+# Import libraries and modules
+import sys, json, threading, contextlib
+from time import perf_counter
+
+class RunMetrics:
+    '''
+    Collects the metrics for one run. Safe to update from worker threads.
+    '''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self, **info):
+        '''
+        Clears all metrics and starts the run clock. Keyword arguments (e.g. date and time) are
+        stored with the metrics.
+        '''
+        self.data = dict(info)
+        self.data.update({'stages': {},'timers': {},'http': {},'retries': {}})
+        self.start = perf_counter()
+        self.current_stage = {'name': None,'start': None}
+
+    def start_stage(self, name=None):
+        '''
+        Ends timing of the current named section of the run and starts timing the next one. Call
+        with no name to end the last section.
+        '''
+        now = perf_counter()
+        if(self.current_stage['name'] is not None):
+            self.data['stages'][self.current_stage['name']] = round(now - self.current_stage['start'],3)
+        self.current_stage = {'name': name,'start': now}
+
+    @contextlib.contextmanager
+    def timed(self, name):
+        '''
+        Adds the time spent in the with-block to the named timer. Timers used from several
+        threads add up the time spent in each.
+        '''
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            with self.lock:
+                timers = self.data['timers']
+                timers[name] = round(timers.get(name,0) + perf_counter() - start,3)
+
+    def count_http(self, service, nbytes):
+        '''
+        Counts one HTTP response and its size for FEMS or AGOL.
+        '''
+        with self.lock:
+            counts = self.data['http'].setdefault(service,{'requests': 0,'bytes': 0})
+            counts['requests'] = counts['requests'] + 1
+            counts['bytes'] = counts['bytes'] + int(nbytes)
+
+    def count_retry(self, name):
+        '''
+        Counts one retry of a download or upload.
+        '''
+        with self.lock:
+            self.data['retries'][name] = self.data['retries'].get(name,0) + 1
+
+    def write(self, path):
+        '''
+        Ends the last section and writes the run metrics as JSON.
+        '''
+        self.start_stage(None)
+        self.data['total_seconds'] = round(perf_counter() - self.start,3)
+        self.data['peak_memory_mb'] = peak_memory_mb()
+        with open(path,'w') as mf:
+            json.dump(self.data,mf,indent=2)
+
+def peak_memory_mb():
+    '''
+    Returns the peak resident memory of the process in MB, or None if it can't be determined.
+    '''
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return round(peak / (1024 ** 2 if sys.platform == 'darwin' else 1024),1) # Bytes on macOS
+    except ImportError:
+        pass
+    try:
+        import psutil # Windows
+        return round(psutil.Process().memory_info().peak_wset / 1024 ** 2,1)
+    except (ImportError, AttributeError):
+        return None
+
+# Metrics for the current run
+metrics = RunMetrics()
@@ -0,0 +1,294 @@
+'''
+Local stand-in for the FEMS climatology GraphQL API and the NFDRS feature service, for load
+testing the fetch and publish paths without putting load on the real services, e.g.
+
+    python -m nfdrs_trends.mock_server --stations 5000 --latency 0.2 --error-rate 0.05
+
+and then run the update against it with a config file containing
+
+    {"fems_api": "http://127.0.0.1:8000/api/climatology/graphql",
+     "feature_service_url": "http://127.0.0.1:8000/arcgis/rest/services/NFDRS/FeatureServer"}
+
+The data are synthetic (see synthetic). The server answers nfdrMinMax queries with stationIds and
+paging, and the feature service table, query and applyEdits REST endpoints. Response latency,
+page sizes, error rates and data size are set on the command line. Request, error and edit counts
+are served at /stats.
+'''
+
+# Import libraries and modules
+import re, sys, json, time, random, argparse, threading, numpy
+from datetime import datetime
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from .config import load_config
+from .synthetic import make_fixtures, fems_response, parse_query
+
+# Endpoint paths
+FEMS_PATH = '/api/climatology/graphql'
+SERVICE_PATH = '/arcgis/rest/services/NFDRS/FeatureServer'
+
+# Feature service tables, in service order
+TABLE_NAMES = ['Percentiles','PSA_RAWS_Associations','RAWS_Percentiles_Trends','PSA_Percentiles_Trends']
+
+def where_mask(df, where):
+    '''
+    Evaluates the where clauses sent by the client on df: 1=1 and "Field" IN (...) clauses joined
+    by AND. Values are compared as strings.
+    '''
+    mask = numpy.ones(df.shape[0],dtype=bool)
+    for clause in re.split(r'\s+AND\s+',where.strip(),flags=re.I):
+        if(clause.replace(' ','') == '1=1'):
+            continue
+        match = re.fullmatch(r'"?(\w+)"?\s+IN\s+\((.*)\)',clause.strip(),flags=re.I | re.S)
+        if(match is None):
+            raise ValueError('Unsupported where clause: ' + clause)
+        values = [val.strip().strip('\'"') for val in match.group(2).split(',')]
+        mask &= df[match.group(1)].astype(str).isin([val for val in values if val != '']).to_numpy()
+    return mask
+
+def json_records(df):
+    '''
+    Returns the rows of df as feature attribute dicts with missing values as None.
+    '''
+    return df.astype(object).where(df.notna(),None).to_dict('records')
+
+class MockState:
+    '''
+    Data, settings and request counts shared by the request handler threads.
+
+    latency and jitter add a delay of latency plus up to jitter seconds to every request.
+    page_size is the largest FEMS page (and the page returned when no paging is requested) and
+    max_record_count the largest feature service query page. error_rate is the share of FEMS and
+    applyEdits requests answered with HTTP 503, and edit_error_rate the share of features that
+    applyEdits rejects.
+    '''
+    def __init__(self, fixtures, latency=0, jitter=0, page_size=10000, max_record_count=2000,
+                 error_rate=0, edit_error_rate=0, seed=None):
+        self.fems_df = fixtures['fems_df']
+        self.tables = [fixtures['per_df'],fixtures['pra_df'],fixtures['raws_df'].copy(),
+                       fixtures['psa_df'].copy()]
+        self.rows = [dict(zip(tbl['OBJECTID'],range(0,tbl.shape[0]))) for tbl in self.tables]
+        self.edit_dates = [int(time.time() * 1000)] * len(self.tables)
+        self.latency = latency
+        self.jitter = jitter
+        self.page_size = page_size
+        self.max_record_count = max_record_count
+        self.error_rate = error_rate
+        self.edit_error_rate = edit_error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {'requests': {},'errors': 0,'features_updated': 0,'features_rejected': 0}
+
+    def chance(self, rate):
+        with self.lock:
+            return self.random.random() < rate
+
+    def count_request(self, name):
+        with self.lock:
+            self.stats['requests'][name] = self.stats['requests'].get(name,0) + 1
+
+    def add(self, key, n=1):
+        with self.lock:
+            self.stats[key] = self.stats[key] + n
+
+    def fems(self, payload):
+        '''
+        Answers one nfdrMinMax query, limiting pages to page_size records.
+        '''
+        query = parse_query(payload['query'])
+        if(query['page'] is None):
+            query['page'] = 1
+            query['per_page'] = self.page_size
+        query['per_page'] = min(query['per_page'],self.page_size)
+        return 200, fems_response(self.fems_df,**query)
+
+    def service_info(self):
+        return 200, {'currentVersion': 11.3,
+                     'serviceDescription': 'Mock NFDRS Percentiles and Trends service',
+                     'tables': [{'id': i,'name': name} for i, name in enumerate(TABLE_NAMES)],
+                     'editingInfo': {'lastEditDate': max(self.edit_dates)}}
+
+    def table_info(self, i):
+        return 200, {'id': i,'name': TABLE_NAMES[i],'type': 'Table',
+                     'maxRecordCount': self.max_record_count,'objectIdField': 'OBJECTID',
+                     'editingInfo': {'lastEditDate': self.edit_dates[i]},
+                     'fields': [{'name': col} for col in self.tables[i].columns]}
+
+    def query(self, i, params):
+        '''
+        Answers one table query, returning up to max_record_count records from resultOffset.
+        '''
+        with self.lock:
+            df = self.tables[i].loc[where_mask(self.tables[i],params.get('where','1=1'))]
+        offset = int(params.get('resultOffset') or 0)
+        count = min(int(params.get('resultRecordCount') or self.max_record_count),self.max_record_count)
+        page = df.iloc[offset:offset + count]
+        return 200, {'features': [{'attributes': rec} for rec in json_records(page)],
+                     'exceededTransferLimit': offset + count < df.shape[0]}
+
+    def apply_edits(self, i, params):
+        '''
+        Applies feature updates by OBJECTID, rejecting edit_error_rate of them at random.
+        '''
+        results = []
+        with self.lock:
+            df = self.tables[i]
+            for feat in json.loads(params.get('updates') or '[]'):
+                attrs = feat.get('attributes',{})
+                oid = attrs.get('OBJECTID')
+                if((oid not in self.rows[i]) or (self.random.random() < self.edit_error_rate)):
+                    results.append({'objectId': oid,'success': False,
+                                    'error': {'code': 1000,'description': 'Update rejected'}})
+                    continue
+                row = df.index[self.rows[i][oid]]
+                for col, value in attrs.items():
+                    if((col in df.columns) & (col != 'OBJECTID')):
+                        df.at[row,col] = value
+                results.append({'objectId': oid,'success': True})
+            self.edit_dates[i] = int(time.time() * 1000)
+        n_ok = sum([res['success'] for res in results])
+        self.add('features_updated',n_ok)
+        self.add('features_rejected',len(results) - n_ok)
+        return 200, {'addResults': [],'updateResults': results,'deleteResults': []}
+
+    def route(self, method, path, params, payload):
+        '''
+        Returns the status and JSON body for one request.
+        '''
+        path = path.rstrip('/')
+        if(path == '/stats'):
+            with self.lock:
+                return 200, json.loads(json.dumps(self.stats))
+        if(path == FEMS_PATH):
+            name = 'FEMS graphql'
+        elif(path.startswith(SERVICE_PATH)):
+            parts = path[len(SERVICE_PATH):].strip('/').split('/')
+            name = 'AGOL ' + ('service' if parts == [''] else
+                              'table' if len(parts) == 1 else parts[1])
+        else:
+            return 404, {'error': {'code': 404,'message': 'Not found: ' + path}}
+        self.count_request(name)
+
+        # Delay and fail requests on the paths that retry
+        time.sleep(self.latency + self.random.uniform(0,self.jitter))
+        if((name in ('FEMS graphql','AGOL applyEdits')) and self.chance(self.error_rate)):
+            self.add('errors')
+            return 503, {'error': {'code': 503,'message': 'Service unavailable (injected)'}}
+
+        if(name == 'FEMS graphql'):
+            return self.fems(payload)
+        if(name == 'AGOL service'):
+            return self.service_info()
+        i = int(parts[0])
+        if(i >= len(self.tables)):
+            return 404, {'error': {'code': 404,'message': 'Table not found'}}
+        if(name == 'AGOL table'):
+            return self.table_info(i)
+        if(name == 'AGOL query'):
+            return self.query(i,params)
+        if(name == 'AGOL applyEdits'):
+            return self.apply_edits(i,params)
+        return 404, {'error': {'code': 404,'message': 'Not found: ' + path}}
+
+class MockHandler(BaseHTTPRequestHandler):
+    '''
+    Passes GET and POST requests (query string, form or JSON body) to the server's MockState.
+    '''
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.respond()
+
+    def do_POST(self):
+        self.respond()
+
+    def respond(self):
+        url = urlparse(self.path)
+        params = {key: val[-1] for key, val in parse_qs(url.query).items()}
+        payload = None
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length > 0 else b''
+        if('json' in self.headers.get('Content-Type','')):
+            payload = json.loads(body)
+        elif(len(body) > 0):
+            params.update({key: val[-1] for key, val in parse_qs(body.decode()).items()})
+        try:
+            status, data = self.server.state.route(self.command,url.path,params,payload)
+        except Exception as e:
+            status, data = 500, {'error': {'code': 500,'message': str(e)}}
+        body = data if isinstance(data,bytes) else json.dumps(data,default=str).encode()
+        self.send_response(status)
+        self.send_header('Content-Type','application/json')
+        self.send_header('Content-Length',str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if(self.server.verbose):
+            sys.stderr.write(self.address_string() + ' ' + (format % args) + '\n')
+
+def make_server(state, host='127.0.0.1', port=8000, verbose=False):
+    '''
+    Returns a threaded HTTP server for state. Call serve_forever() (e.g. in a thread) to start it
+    and shutdown() to stop it. Use port 0 to pick a free port (see server_address).
+    '''
+    server = ThreadingHTTPServer((host,port),MockHandler)
+    server.daemon_threads = True
+    server.state = state
+    server.verbose = verbose
+    return server
+
+def parse_args(argv=None):
+    '''
+    Parses the command line.
+    '''
+    parser = argparse.ArgumentParser(prog='nfdrs_trends.mock_server',
+                                     description='Mock FEMS GraphQL and NFDRS feature service for load testing.')
+    parser.add_argument('--host',default='127.0.0.1')
+    parser.add_argument('--port',type=int,default=8000)
+    parser.add_argument('--stations',type=int,default=1000,help='number of synthetic stations (default 1000)')
+    parser.add_argument('--breakpoints',type=int,default=100,
+                        help='percentile breakpoints per station and index (default 100)')
+    parser.add_argument('--date',default=datetime.today().strftime('%Y-%m-%d'),
+                        help="update date the FEMS data are generated around (default today)")
+    parser.add_argument('--end-date',default=None,
+                        help='also generate FEMS data for update dates through this date (for backfills)')
+    parser.add_argument('--seed',type=int,default=0,help='random seed for data and failures')
+    parser.add_argument('--latency',type=float,default=0,help='seconds added to every request')
+    parser.add_argument('--jitter',type=float,default=0,help='up to this many extra seconds per request')
+    parser.add_argument('--page-size',type=int,default=10000,help='largest FEMS page (default 10000)')
+    parser.add_argument('--max-record-count',type=int,default=2000,
+                        help='largest feature service query page (default 2000)')
+    parser.add_argument('--error-rate',type=float,default=0,
+                        help='share of FEMS and applyEdits requests that fail with HTTP 503')
+    parser.add_argument('--edit-error-rate',type=float,default=0,
+                        help='share of updated features that applyEdits rejects')
+    parser.add_argument('--config',default=None,
+                        help='JSON settings file whose fuel model and index pairs (indices) the data cover')
+    parser.add_argument('--verbose',action='store_true',help='log every request')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    '''
+    Runs the mock server until interrupted, then prints the request counts.
+    '''
+    args = parse_args(argv)
+    fixtures = make_fixtures(args.stations,args.date,args.breakpoints,seed=args.seed,
+                             last_date=args.end_date,indices=load_config(args.config)['indices'])
+    state = MockState(fixtures,args.latency,args.jitter,args.page_size,args.max_record_count,
+                      args.error_rate,args.edit_error_rate,args.seed)
+    server = make_server(state,args.host,args.port,args.verbose)
+    base = 'http://' + args.host + ':' + str(server.server_address[1])
+    print('Mock server for ' + str(args.stations) + ' stations on ' + base + ', run with config:')
+    print(json.dumps({'fems_api': base + FEMS_PATH,'feature_service_url': base + SERVICE_PATH},indent=2))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    print(json.dumps(state.stats,indent=2))
+    return 0
+
+if(__name__ == '__main__'):
+    sys.exit(main())
@@ -0,0 +1,176 @@
+'''
+Percentile lookups: compiles the Percentiles table into sorted per-station breakpoint arrays and
+resolves station values to percentiles in one vectorized pass. Lookups are keyed by fuel model
+and index (see indices.lookup_key, e.g. Y_ERC).
+'''
+
+# Import libraries and modules
+import os, json, pandas, numpy
+from .indices import DEFAULT_INDICES, lookup_key
+from .schema import VALUE_DTYPE
+
+# Arrays stored for each component in a compiled percentile artifact
+PERCENTILE_ARRAYS = ['stations','offsets','lo','hi','gte','lt','percentiles']
+
+# Fuel model of the breakpoints in a Percentiles table without a Fuel_Model field
+TABLE_FUEL_MODEL = 'Y'
+
+def build_percentile_lookup(per_df, component, fuel_model=None):
+    '''
+    Compiles the percentile breakpoints for one component (e.g. ERC) into contiguous arrays
+    (float32 breakpoints and float64 percentiles) ordered by station then GreaterThanEqualTo, with
+    a per-station offset index, so values for every station can be resolved together without
+    filtering per_df. If per_df has a Fuel_Model field, only the rows for fuel_model are used. A
+    table without one only holds fuel model Y breakpoints, so other fuel models get an empty
+    lookup (every percentile missing).
+    '''
+    rows = per_df['Component'] == component
+    if((fuel_model is not None) and ('Fuel_Model' in per_df.columns)):
+        rows = rows & (per_df['Fuel_Model'] == fuel_model)
+    elif((fuel_model is not None) and (fuel_model != TABLE_FUEL_MODEL)):
+        rows = rows & False
+    cper = per_df.loc[rows,['Station_ID','GreaterThanEqualTo','LessThan','Percentile']]
+    cper = cper.sort_values(['Station_ID','GreaterThanEqualTo'],kind='stable')
+    sids = cper['Station_ID'].to_numpy()
+    if(sids.dtype == object):
+        sids = sids.astype(str) # Fixed-width strings so the array can be memory-mapped
+    gte = cper['GreaterThanEqualTo'].to_numpy(dtype='float32')
+    lt = cper['LessThan'].to_numpy(dtype='float32')
+    stations, starts = numpy.unique(sids,return_index=True)
+    return {'stations': stations,
+            'offsets': numpy.append(starts,len(sids)).astype('int64'),
+            'lo': numpy.minimum.reduceat(gte,starts) if len(gte) > 0 else gte,
+            'hi': numpy.maximum.reduceat(lt,starts) if len(lt) > 0 else lt,
+            'gte': gte,
+            'lt': lt,
+            'percentiles': cper['Percentile'].to_numpy(dtype='float64')}
+
+def build_percentile_lookups(per_df, indices=DEFAULT_INDICES):
+    '''
+    Compiles the lookup of every fuel model and index pair in indices, keyed by lookup_key.
+    '''
+    return {lookup_key(spec): build_percentile_lookup(per_df,spec['component'],spec['fuel_model'])
+            for spec in indices}
+
+def compile_percentiles(per_df, path, token, indices=DEFAULT_INDICES):
+    '''
+    Writes the compiled lookups for the pairs in indices as .npy files under path so later runs
+    and worker processes can memory-map them. The token is written last and marks the artifact
+    as complete.
+    '''
+    save_percentiles(build_percentile_lookups(per_df,indices),path,token)
+
+def save_percentiles(lookups, path, token):
+    '''
+    Writes already compiled lookups (keyed by lookup_key) as a percentile artifact under path.
+    '''
+    os.makedirs(path,exist_ok=True)
+    token_path = os.path.join(path,'token.json')
+    if(os.path.exists(token_path)):
+        os.remove(token_path)
+    for comp, comp_lookup in lookups.items():
+        for name in PERCENTILE_ARRAYS:
+            numpy.save(os.path.join(path,comp + '_' + name + '.npy'),comp_lookup[name])
+    with open(token_path,'w') as tf:
+        json.dump({'token': token,'components': list(lookups)},tf)
+
+def load_percentiles(path, token, keys=None):
+    '''
+    Memory-maps a compiled percentile artifact as read-only arrays keyed by lookup_key. Returns
+    None if the artifact is missing, was built from a different version of the table or doesn't
+    have every lookup in keys.
+    '''
+    token_path = os.path.join(path,'token.json')
+    if(not os.path.exists(token_path)):
+        return None
+    with open(token_path) as tf:
+        meta = json.load(tf)
+    if(meta.get('token') != token):
+        return None
+    if((keys is not None) and (not set(keys) <= set(meta['components']))):
+        return None
+    lookups = {}
+    for comp in meta['components']:
+        lookups[comp] = {name: numpy.load(os.path.join(path,comp + '_' + name + '.npy'),mmap_mode='r')
+                         for name in PERCENTILE_ARRAYS}
+    return lookups
+
+def lookup_percentiles(lookup, station_ids, values):
+    '''
+    Resolves the percentile of every station/value pair in one vectorized pass. Values below a
+    station's lowest breakpoint are assigned 0.01 and values at or above its highest breakpoint
+    are assigned 100.00. Missing values and stations without a percentile table return NA.
+    Returns a Float64 array holding the percentiles as stored in the lookup.
+    '''
+    sids = numpy.asarray(station_ids)
+    vals = pandas.to_numeric(pandas.Series(values),errors='coerce').to_numpy(dtype='float64',
+                                                                              na_value=numpy.nan)
+    result = numpy.full(len(sids),numpy.nan,dtype='float64')
+    if(len(lookup['stations']) == 0 or len(sids) == 0):
+        return pandas.array(result,dtype=VALUE_DTYPE)
+
+    # Locate each station's block of breakpoints
+    pos = numpy.searchsorted(lookup['stations'],sids)
+    pos = numpy.minimum(pos,len(lookup['stations']) - 1)
+    found = (lookup['stations'][pos] == sids) & ~numpy.isnan(vals)
+    vals = vals.astype('float32') # Compare at the precision the breakpoints are stored in
+    lo = lookup['lo'][pos]
+    hi = lookup['hi'][pos]
+
+    # Clamp values outside the historical range
+    below = found & (vals < lo)
+    above = found & (vals >= hi)
+    inside = found & ~below & ~above
+    result[below] = 0.01
+    result[above] = 100.00
+
+    # Binary search each station's block for the row where GreaterThanEqualTo <= value < LessThan
+    v = vals[inside]
+    start = lookup['offsets'][pos[inside]]
+    end = lookup['offsets'][pos[inside] + 1]
+    while(True):
+        active = start < end
+        if(not active.any()):
+            break
+        mid = numpy.where(active,(start + end) // 2,0)
+        right = active & (lookup['gte'][mid] <= v)
+        start = numpy.where(right,mid + 1,start)
+        end = numpy.where(active & ~right,mid,end)
+
+    result[inside] = lookup['percentiles'][start - 1]
+    return pandas.array(result,dtype=VALUE_DTYPE)
+
+def merge_lookups(lookups, keys):
+    '''
+    Concatenates the lookups for keys into one lookup whose stations are (key, station) codes, so
+    values for several fuel model and index pairs can be resolved in a single lookup_percentiles
+    pass. Use merged_ids for the codes of the stations to resolve.
+    '''
+    station_arrays = [lookups[key]['stations'] for key in keys if len(lookups[key]['stations']) > 0]
+    codes = numpy.unique(numpy.concatenate(station_arrays)) if len(station_arrays) > 0 else numpy.array([])
+    parts = {name: [] for name in PERCENTILE_ARRAYS}
+    base = 0
+    for i, key in enumerate(keys):
+        lookup = lookups[key]
+        parts['stations'].append(i * len(codes) + numpy.searchsorted(codes,lookup['stations']))
+        parts['offsets'].append(numpy.asarray(lookup['offsets'][:-1]) + base)
+        for name in ['lo','hi','gte','lt','percentiles']:
+            parts[name].append(numpy.asarray(lookup[name]))
+        base = base + len(lookup['gte'])
+    merged = {name: numpy.concatenate(parts[name]) for name in PERCENTILE_ARRAYS}
+    merged['stations'] = merged['stations'].astype('int64')
+    merged['offsets'] = numpy.append(merged['offsets'],base).astype('int64')
+    merged['codes'] = codes
+    return merged
+
+def merged_ids(merged, key_index, station_ids):
+    '''
+    Returns the merge_lookups codes of station_ids for the key at position key_index (a number or
+    an array aligned with station_ids). Stations without a percentile table get -1.
+    '''
+    sids = numpy.asarray(station_ids)
+    codes = merged['codes']
+    if(len(codes) == 0):
+        return numpy.full(len(sids),-1,dtype='int64')
+    pos = numpy.minimum(numpy.searchsorted(codes,sids),len(codes) - 1)
+    return numpy.where(codes[pos] == sids,numpy.asarray(key_index) * len(codes) + pos,-1).astype('int64')
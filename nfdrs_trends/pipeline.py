@@ -0,0 +1,297 @@
+'''
+Runs the full update: AGOL base data, FEMS download, RAWS and PSA analysis, service update.
+
+With the overlap_stages setting the network calls that don't depend on each other run at the
+same time (see Pipeline.cycle_overlapped): the FEMS download, the percentile lookups and both
+target table queries start together once the station list is known, and the RAWS upload runs
+while the PSA means are computed.
+'''
+
+# Import libraries and modules
+import logging
+from time import monotonic
+from concurrent.futures import ThreadPoolExecutor
+from .metrics import metrics
+from . import agol
+from .fems import fems_dates, fetch_fems_data
+from .raws import compute_raws, compute_raws_incremental
+from .psa import aggregate_psa
+from .store import RollingStore
+from .archive import archive_run
+from .spatial import spatial_associations
+
+log = logging.getLogger(__name__)
+
+class Pipeline:
+    '''
+    Runs the stages for one update date and time per cycle. With keep_state, the service
+    connection, reference tables, the values last published to the target tables and the FEMS
+    records (in an in-memory rolling store) are kept between cycles, so later cycles only fetch,
+    compute and publish what changed. Reference and target tables are reloaded after
+    reference_refresh_hours. With the incremental setting the rolling store is kept on disk.
+    '''
+    def __init__(self, config, keep_state=False):
+        self.config = config
+        self.keep_state = keep_state
+        self.store = None
+        if(config['incremental']):
+            self.store = RollingStore(config['store_dir'],config['store_days'])
+        elif(keep_state):
+            self.store = RollingStore(None,config['store_days'])
+        self.reset()
+
+    def reset(self):
+        '''
+        Drops the service connection and loaded tables, so the next cycle starts from AGOL again.
+        '''
+        self.service = None
+        self.tables = None
+        self.per_lookups = None
+        self.pra_df = None
+        self.targets = None
+        self.loaded_at = None
+
+    def references_stale(self):
+        '''
+        Returns whether the reference tables need to be (re)loaded.
+        '''
+        max_age = self.config['reference_refresh_hours'] * 3600
+        return (self.loaded_at is None) or (monotonic() - self.loaded_at > max_age)
+
+    def load_associations(self):
+        '''
+        Returns the PSA_RAWS_Associations table, or the spatial memberships in spatial mode.
+        '''
+        pra_df = agol.load_associations(self.service,self.tables,self.config['cache_dir'])
+        if(self.config['psa_membership'] == 'spatial'):
+            pra_df = spatial_associations(self.config,pra_df)
+        return pra_df
+
+    def load_base_data(self):
+        '''
+        Connects to the service and loads the reference and target tables, unless they are kept
+        from an earlier cycle and are still fresh.
+        '''
+        if(self.service is None):
+            self.service, self.tables = agol.connect(self.config)
+        if(self.references_stale()):
+            self.per_lookups = agol.load_percentile_lookups(self.service,self.tables,
+                                                            self.config['cache_dir'],
+                                                            self.config['indices'])
+            self.pra_df = self.load_associations()
+            self.targets = None
+            self.loaded_at = monotonic()
+        if(self.targets is None):
+            self.targets = agol.load_target_tables(self.tables,self.pra_df)
+        else:
+            log.info('.Reference tables and target values kept from the last cycle')
+
+    def fetch(self, dates, station_ids):
+        '''
+        Returns the FEMS records for the observation and forecast window in dates (see
+        fems_dates), through the rolling store if there is one.
+        '''
+        if(self.store is not None):
+            return self.store.fetch(self.config,dates,station_ids)
+        return fetch_fems_data(self.config,dates['o_sdate'],dates['f_edate'],station_ids)
+
+    def compute(self, raws_prev, fd_df, dates, udate, utime):
+        '''
+        Returns the RAWS results and per-station values, recomputing only the stations whose
+        inputs changed if there is a rolling store.
+        '''
+        config = self.config
+        if(self.store is not None):
+            raws_df, raws2psa_df = compute_raws_incremental(raws_prev,self.pra_df,fd_df,self.per_lookups,
+                                                            dates,udate,utime,config['trend_threshold'],
+                                                            self.store.previous(self.per_lookups,
+                                                                                config['trend_threshold']),
+                                                            config['indices'])
+            self.store.save(udate,raws_df,raws2psa_df,self.per_lookups,config['trend_threshold'])
+        else:
+            raws_df, raws2psa_df = compute_raws(raws_prev,self.pra_df,fd_df,self.per_lookups,dates,
+                                                udate,utime,config['trend_threshold'],config['indices'])
+        return raws_df, raws2psa_df
+
+    def archive(self, fd_df, raws_df, psa_df, udate, utime):
+        '''
+        Archives the run's FEMS records and results. A failed archive is logged and doesn't stop
+        the update.
+        '''
+        try:
+            archive_run({'fems': fd_df,'raws': raws_df,'psa': psa_df},self.config['archive_dir'],udate,
+                        utime,self.config['archive_compression'],self.config['indices'])
+        except Exception:
+            log.exception('.Archive failed, continuing with the update') # Archive is optional
+
+    def published(self, raws_df, psa_df, upload_failed):
+        '''
+        Keeps the published results as the service values for the next cycle, unless some rows
+        failed (then the target tables are re-read).
+        '''
+        if(self.keep_state):
+            if(sum([len(ids) for ids in upload_failed.values()]) > 0):
+                self.targets = None
+            else:
+                self.targets = (raws_df,psa_df)
+
+    def cycle(self, udate, utime, dry_run=False):
+        '''
+        Runs every stage for the update date ('YYYY-MM-DD') and time ('HHMM'). With dry_run the
+        results are computed but not sent to the service. Returns the RAWS and PSA results and
+        the object IDs that failed to upload. Raises FEMSDownloadError if FEMS data can't be
+        downloaded.
+        '''
+        if(self.config['overlap_stages']):
+            return self.cycle_overlapped(udate,utime,dry_run)
+        config = self.config
+
+        #############################################################################################
+        ### Connect to AGOL service for required base data
+        #############################################################################################
+        metrics.start_stage('Connect to AGOL service for required base data')
+        log.info('Connect to AGOL service for required base data')
+        self.load_base_data()
+        pra_df = self.pra_df
+        raws_prev, psa_prev = self.targets # Values currently in the service
+
+        #############################################################################################
+        ### Grab NFDRS observations and forecasts from FEMS
+        #############################################################################################
+        metrics.start_stage('Grab NFDRS observations and forecasts from FEMS')
+        log.info('Grab NFDRS observations and forecasts from FEMS')
+        dates = fems_dates(udate)
+        fd_df = self.fetch(dates,pra_df['Station_ID'].tolist())
+
+        #############################################################################################
+        ### RAWS NFDRS Percentiles and 3-DAY Trends
+        #############################################################################################
+        metrics.start_stage('RAWS NFDRS Percentiles and 3-DAY Trends')
+        log.info('RAWS NFDRS Percentiles and 3-DAY Trends')
+        raws_df, raws2psa_df = self.compute(raws_prev,fd_df,dates,udate,utime)
+
+        #############################################################################################
+        ### PSA NFDRS Percentiles and 3-DAY Trends
+        #############################################################################################
+        metrics.start_stage('PSA NFDRS Percentiles and 3-DAY Trends')
+        log.info('PSA NFDRS Percentiles and 3-DAY Trends')
+        psa_df, psa_means = aggregate_psa(psa_prev,pra_df,raws2psa_df,udate,utime,
+                                          config['trend_threshold'],config['indices'])
+
+        #############################################################################################
+        ### Archive run inputs and results
+        #############################################################################################
+        if(config['archive_dir'] is not None):
+            metrics.start_stage('Archive run inputs and results')
+            log.info('Archive run inputs and results')
+            self.archive(fd_df,raws_df,psa_df,udate,utime)
+
+        #############################################################################################
+        ### UPDATE SERVICE
+        #############################################################################################
+        upload_failed = {'RAWS': [],'PSA': []}
+        if(dry_run):
+            log.info('Dry run, service not updated')
+        else:
+            metrics.start_stage('Updating service')
+            log.info('Updating service')
+            upload_failed = agol.publish(self.tables,raws_df,raws_prev,psa_df,psa_prev,config)
+            self.published(raws_df,psa_df,upload_failed) # The service now holds these values
+
+        return {'raws': raws_df,'raws2psa': raws2psa_df,'psa': psa_df,'psa_means': psa_means,
+                'upload_failed': upload_failed}
+
+    def cycle_overlapped(self, udate, utime, dry_run=False):
+        '''
+        Runs the same stages as cycle, with the calls that don't depend on each other overlapped
+        on a thread pool. Once the station list is known, the FEMS download, the percentile
+        lookups and the RAWS and PSA target table queries run at the same time. The RAWS rows
+        are uploaded while the PSA means are computed, and the archive is written while the PSA
+        rows are uploaded. Returns the same results as cycle.
+        '''
+        config = self.config
+        dates = fems_dates(udate)
+        with ThreadPoolExecutor(max_workers=4) as pool:
+
+            #########################################################################################
+            ### Load AGOL base data and FEMS records concurrently
+            #########################################################################################
+            metrics.start_stage('Load AGOL base data and FEMS records concurrently')
+            log.info('Load AGOL base data and FEMS records concurrently')
+            if(self.service is None):
+                self.service, self.tables = agol.connect(config)
+            per_future = None
+            if(self.references_stale()):
+                per_future = pool.submit(agol.load_percentile_lookups,self.service,self.tables,
+                                         config['cache_dir'],config['indices'])
+                self.pra_df = self.load_associations() # The station list everything else needs
+                self.targets = None
+            pra_df = self.pra_df
+            fems_future = pool.submit(self.fetch,dates,pra_df['Station_ID'].tolist())
+            if(self.targets is None):
+                target_futures = [pool.submit(agol.load_target_table,self.tables[2],'Station_ID',
+                                              pra_df['Station_ID'].tolist()),
+                                  pool.submit(agol.load_target_table,self.tables[3],'PSANationalCode',
+                                              pra_df['PSA'].tolist())]
+            else:
+                log.info('.Reference tables and target values kept from the last cycle')
+            if(per_future is not None):
+                self.per_lookups = per_future.result()
+                self.loaded_at = monotonic()
+            if(self.targets is None):
+                self.targets = tuple([future.result() for future in target_futures])
+            raws_prev, psa_prev = self.targets # Values currently in the service
+            fd_df = fems_future.result()
+
+            #########################################################################################
+            ### RAWS NFDRS Percentiles and 3-DAY Trends
+            #########################################################################################
+            metrics.start_stage('RAWS NFDRS Percentiles and 3-DAY Trends')
+            log.info('RAWS NFDRS Percentiles and 3-DAY Trends')
+            raws_df, raws2psa_df = self.compute(raws_prev,fd_df,dates,udate,utime)
+            upload_futures = []
+            if(not dry_run): # Upload the RAWS rows while the PSA means are computed
+                raws_upd = agol.rows_to_upload('RAWS',self.tables[2],raws_df,raws_prev,config)
+                upload_futures.append(pool.submit(agol.upload_tables,[('RAWS',self.tables[2],raws_upd)],
+                                                  config['upload_chunk_size'],config['upload_workers'],
+                                                  config['upload_attempts']))
+
+            #########################################################################################
+            ### PSA NFDRS Percentiles and 3-DAY Trends
+            #########################################################################################
+            metrics.start_stage('PSA NFDRS Percentiles and 3-DAY Trends')
+            log.info('PSA NFDRS Percentiles and 3-DAY Trends')
+            psa_df, psa_means = aggregate_psa(psa_prev,pra_df,raws2psa_df,udate,utime,
+                                              config['trend_threshold'],config['indices'])
+            if(not dry_run):
+                psa_upd = agol.rows_to_upload('PSA',self.tables[3],psa_df,psa_prev,config)
+                upload_futures.append(pool.submit(agol.upload_tables,[('PSA',self.tables[3],psa_upd)],
+                                                  config['upload_chunk_size'],config['upload_workers'],
+                                                  config['upload_attempts']))
+
+            #########################################################################################
+            ### Archive run inputs and results and finish updating service
+            #########################################################################################
+            metrics.start_stage('Archive and finish updating service')
+            if(config['archive_dir'] is not None):
+                log.info('Archive run inputs and results')
+                self.archive(fd_df,raws_df,psa_df,udate,utime)
+            upload_failed = {'RAWS': [],'PSA': []}
+            if(dry_run):
+                log.info('Dry run, service not updated')
+            else:
+                for future in upload_futures:
+                    upload_failed.update(future.result())
+                agol.report_failed(upload_failed,config['upload_attempts'])
+                self.published(raws_df,psa_df,upload_failed) # The service now holds these values
+
+        return {'raws': raws_df,'raws2psa': raws2psa_df,'psa': psa_df,'psa_means': psa_means,
+                'upload_failed': upload_failed}
+
+def run(config, udate, utime, dry_run=False):
+    '''
+    Runs every stage once for the update date ('YYYY-MM-DD') and time ('HHMM'); see
+    Pipeline.cycle. With the incremental setting, FEMS records and RAWS results are reused from
+    the rolling store (see store) where inputs haven't changed.
+    '''
+    return Pipeline(config).cycle(udate,utime,dry_run)
@@ -0,0 +1,80 @@
+'''
+PSA NFDRS percentiles and 3-day trends, averaged from the RAWS results.
+'''
+
+# Import libraries and modules
+import logging, numpy
+from .indices import DEFAULT_INDICES, spec_key
+from .trends import classify_trends, trend_summary
+from .schema import TREND_DTYPE, exact_float64, value_array
+
+log = logging.getLogger(__name__)
+
+def aggregate_psa(psa_df, pra_df, raws2psa_df, udate, utime, threshold=3, indices=DEFAULT_INDICES):
+    '''
+    Averages the per-station values from compute_raws by PSA and fills the PSA_Percentiles_Trends
+    rows with the PSA means and their trends for every fuel model and index pair in indices.
+    Non-reporting stations are skipped by the means and PSAs with no reporting stations get NA.
+    If pra_df has a Weight column (see spatial) the means are weighted by it.
+    Returns the updated copy of psa_df, with Float64 values and percentiles and categorical
+    trends, and the PSA means.
+    '''
+    psa_df = psa_df.copy()
+
+    # Join station values to their PSAs once and average every column by PSA
+    weighted = 'Weight' in pra_df.columns
+    psa_vals = pra_df[['PSA','Station_ID'] + (['Weight'] if weighted else [])].drop_duplicates(['PSA','Station_ID'])
+    psa_vals = psa_vals.loc[psa_vals['PSA'] != 'Non-PSA'] # Ignore non-PSA stations
+    station_vals = raws2psa_df.drop(columns=['Station_Name'])
+    for col in station_vals.columns[1:]: # Plain float64 columns with NaN for missing values
+        station_vals[col] = exact_float64(station_vals[col])
+    psa_vals = psa_vals.merge(station_vals,on='Station_ID',how='left')
+    if(weighted): # Sum of weighted values over the weights of the reporting stations
+        weights = psa_vals.pop('Weight').to_numpy(dtype='float64')
+        vals = psa_vals.drop(columns=['Station_ID']).set_index('PSA')
+        totals = vals.mul(weights,axis=0).groupby(level=0).sum()
+        shares = vals.notna().mul(weights,axis=0).groupby(level=0).sum()
+        psa_means = (totals / shares.where(shares > 0)).round(2)
+    else:
+        psa_means = psa_vals.drop(columns=['Station_ID']).groupby('PSA').mean().round(2)
+
+    # Get list of PSAs to update
+    PSAs = sorted(psa_means.index.tolist())
+
+    # Classify observation and forecast trends from the PSA start and end means
+    log.info('.Classifying ' + ', '.join([spec_key(spec) for spec in indices]) + ' trends')
+    for spec in indices:
+        key = spec_key(spec)
+        psa_means[key + '_obs_trend'] = classify_trends(psa_means[key + '_obs_start'],
+                                                        psa_means[key + '_obs_end'],threshold)
+        psa_means[key + '_fcast_trend'] = classify_trends(psa_means[key + '_fcast_start'],
+                                                          psa_means[key + '_fcast_end'],threshold)
+        log.info('..' + key + ' observed: ' + trend_summary(psa_means[key + '_obs_trend']))
+        log.info('..' + key + ' forecast: ' + trend_summary(psa_means[key + '_fcast_trend']))
+
+    # Populate results data frame
+    upd = psa_df['PSANationalCode'].isin(PSAs)
+    for spec in indices:
+        field, key = 'avg_' + spec['field'], spec_key(spec)
+        for col, mcol in [(field,key + '_obs_end'),
+                          (field + '_percentile',key + '_obs_per'),
+                          (field + '_trend',key + '_obs_trend'),
+                          (field + '_fcast',key + '_fcast_start'),
+                          (field + '_fcast_percentile',key + '_fcast_per'),
+                          (field + '_fcast_trend',key + '_fcast_trend')]:
+            mapped = psa_df['PSANationalCode'].map(psa_means[mcol])
+            if(col.endswith('_trend')):
+                psa_df[col] = psa_df[col].astype(object).where(~upd,mapped.astype(object)).astype(TREND_DTYPE)
+            else:
+                psa_df[col] = value_array(numpy.where(upd,exact_float64(mapped),exact_float64(psa_df[col])))
+
+    # Fill in update date and time
+    psa_df.loc[upd,'update_date'] = udate
+    psa_df.loc[upd,'update_time'] = utime
+
+    # Per-PSA detail records (DEBUG only)
+    if(log.isEnabledFor(logging.DEBUG)):
+        for rec in psa_means.reset_index().to_dict('records'):
+            log.debug('..PSA ' + str(rec['PSA']),extra={'data': rec})
+
+    return psa_df, psa_means
@@ -0,0 +1,203 @@
+'''
+RAWS NFDRS percentiles and 3-day trends, for every fuel model and index pair in the indices
+setting (see indices).
+'''
+
+# Import libraries and modules
+import logging, pandas, numpy
+from .indices import FEMS_INDEX_FIELDS, DEFAULT_INDICES, spec_key, lookup_key, result_fields
+from .percentiles import lookup_percentiles, merge_lookups, merged_ids
+from .trends import classify_trends, trend_summary
+from .schema import VALUE_DTYPE, TREND_DTYPE, exact_float64, value_array
+
+log = logging.getLogger(__name__)
+
+# Result fields of the RAWS_Percentiles_Trends table for the default fuel model Y ERC and BI
+# (PSA_Percentiles_Trends uses avg_ + field)
+RESULT_FIELDS = result_fields()
+
+# Per-station columns of each pair passed to the PSA analysis, after its spec_key (e.g. ERC_obs_per)
+PSA_INPUT_SUFFIXES = ['_obs_per','_obs_start','_obs_end','_fcast_per','_fcast_start','_fcast_end']
+
+def pivot_fems(fd_df):
+    '''
+    Indexes the FEMS results once by station, with a column for each index, fuel model and date,
+    so start and end values for every station can be pulled with aligned lookups. Keeps the first
+    record for any duplicated station/fuel model/date.
+    '''
+    fd_piv = fd_df.drop_duplicates(['station_id','fuel_model','date'])
+    fd_piv = fd_piv.pivot(index='station_id',columns=['fuel_model','date'],
+                          values=[comp for comp in FEMS_INDEX_FIELDS if comp in fd_df.columns])
+    return fd_piv
+
+def station_values(fd_piv, station_ids, component, date, fuel_model='Y'):
+    '''
+    Returns one index value of one fuel model on one date for each station in station_ids, in the
+    same order. Stations or dates missing from FEMS return NA.
+    '''
+    if((component,fuel_model,date) in fd_piv.columns):
+        vals = fd_piv[(component,fuel_model,date)].reindex(station_ids)
+    else:
+        vals = pandas.Series(numpy.nan,index=station_ids)
+    return pandas.array(exact_float64(vals),dtype='Float64')
+
+def station_inputs(fd_piv, station_ids, dates, indices=DEFAULT_INDICES):
+    '''
+    Returns the observation and forecast start and end values of every pair in indices for each
+    station in station_ids, indexed by station. These are the only FEMS values a station's
+    results use.
+    '''
+    rvals_df = pandas.DataFrame(index=station_ids)
+    for spec in indices:
+        for col, date in [('_obs_start','o_sdate'),('_obs_end','o_edate'),('_fcast_start','f_sdate'),
+                          ('_fcast_end','f_edate')]:
+            rvals_df[spec_key(spec) + col] = station_values(fd_piv,station_ids,spec['component'],
+                                                            dates[date],spec['fuel_model'])
+    return rvals_df
+
+def compute_raws(raws_df, pra_df, fd_df, per_lookups, dates, udate, utime, threshold=3,
+                 indices=DEFAULT_INDICES):
+    '''
+    Fills the RAWS_Percentiles_Trends rows with observed and forecast values, percentiles and
+    trends of every fuel model and index pair in indices for the FEMS observation and forecast
+    windows in dates (see fems_dates). Trends and percentiles of all pairs are resolved together
+    in one pass each. Returns the updated copy of raws_df and the per-station values needed for
+    the PSA analysis.
+    '''
+    raws_df = raws_df.copy()
+    keys = [spec_key(spec) for spec in indices]
+
+    # Create table to store RAWS data needed for PSA analysis, with typed empty columns
+    raws2psa_df = pra_df[['Station_ID','Station_Name']].drop_duplicates()
+    raws2psa_df = raws2psa_df.reset_index(drop=True)
+    raws2psa_df['Station_Name'] = raws2psa_df['Station_Name'].astype('category')
+    for key in keys:
+        for col in PSA_INPUT_SUFFIXES:
+            raws2psa_df[key + col] = pandas.array(numpy.full(raws2psa_df.shape[0],numpy.nan),dtype=VALUE_DTYPE)
+
+    # Index FEMS results by station and date once
+    fd_piv = pivot_fems(fd_df)
+
+    # Extract observation and forecast start and end values for all stations
+    rvals_df = station_inputs(fd_piv,raws_df['Station_ID'],dates,indices)
+    for spec, key in zip(indices,keys):
+        raws_df[spec['field']] = value_array(rvals_df[key + '_obs_end'])
+        raws_df[spec['field'] + '_fcast'] = value_array(rvals_df[key + '_fcast_start'])
+
+    # Populate data needed for PSA analysis (stations missing from the RAWS table stay NA, and a
+    # station listed twice in it has the same values in both rows)
+    station_rvals = rvals_df.loc[~rvals_df.index.duplicated()]
+    for col in rvals_df.columns:
+        raws2psa_df[col] = value_array(station_rvals[col].reindex(raws2psa_df['Station_ID']))
+
+    # Fill in update date and time
+    raws_df['update_date'] = udate
+    raws_df['update_time'] = utime
+
+    # Classify observation and forecast trends of every pair at once
+    log.info('.Classifying ' + ', '.join(keys) + ' trends')
+    n_raws = raws_df.shape[0]
+    trends = classify_trends(numpy.concatenate([rvals_df[key + col].to_numpy(dtype='float64',na_value=numpy.nan)
+                                                for key in keys for col in ['_obs_start','_fcast_start']]),
+                             numpy.concatenate([rvals_df[key + col].to_numpy(dtype='float64',na_value=numpy.nan)
+                                                for key in keys for col in ['_obs_end','_fcast_end']]),
+                             threshold)
+    for i, (spec, key) in enumerate(zip(indices,keys)):
+        raws_df[spec['field'] + '_trend'] = trends[2 * i * n_raws:(2 * i + 1) * n_raws]
+        raws_df[spec['field'] + '_fcast_trend'] = trends[(2 * i + 1) * n_raws:(2 * i + 2) * n_raws]
+        log.info('..' + key + ' observed: ' + trend_summary(raws_df[spec['field'] + '_trend']))
+        log.info('..' + key + ' forecast: ' + trend_summary(raws_df[spec['field'] + '_fcast_trend']))
+
+    # Resolve observation and forecast percentiles of every pair for all stations in one pass
+    log.info('.Calculating ' + ', '.join(keys) + ' percentiles')
+    merged = merge_lookups(per_lookups,[lookup_key(spec) for spec in indices])
+    blocks = [] # Key position, station IDs, values and the column the percentiles go to
+    for i, (spec, key) in enumerate(zip(indices,keys)):
+        blocks += [(i,raws_df['Station_ID'],raws_df[spec['field']],(raws_df,spec['field'] + '_percentile')),
+                   (i,raws_df['Station_ID'],raws_df[spec['field'] + '_fcast'],
+                    (raws_df,spec['field'] + '_fcast_percentile')),
+                   (i,raws2psa_df['Station_ID'],raws2psa_df[key + '_obs_end'],(raws2psa_df,key + '_obs_per')),
+                   (i,raws2psa_df['Station_ID'],raws2psa_df[key + '_fcast_start'],(raws2psa_df,key + '_fcast_per'))]
+    codes = merged_ids(merged,numpy.concatenate([numpy.full(len(block[1]),block[0]) for block in blocks]),
+                       numpy.concatenate([block[1].to_numpy() for block in blocks]))
+    pers = lookup_percentiles(merged,codes,numpy.concatenate([pandas.to_numeric(block[2],errors='coerce')
+                                                              .to_numpy(dtype='float64',na_value=numpy.nan)
+                                                              for block in blocks]))
+    start = 0
+    for i, sids, vals, (df, col) in blocks:
+        df[col] = pers[start:start + len(sids)]
+        start = start + len(sids)
+    for spec, key in zip(indices,keys):
+        n_obs = int(raws_df[spec['field'] + '_percentile'].notna().sum())
+        n_fcast = int(raws_df[spec['field'] + '_fcast_percentile'].notna().sum())
+        log.info('..' + key + ': ' + str(n_obs) + ' observation and ' + str(n_fcast) +
+                 ' forecast percentiles for ' + str(n_raws) + ' stations')
+
+    # Per-station detail records (DEBUG only)
+    if(log.isEnabledFor(logging.DEBUG)):
+        detail_df = pandas.concat([raws_df[['Station_ID','Station_Name']].reset_index(drop=True),
+                                   rvals_df.reset_index(drop=True)],axis=1)
+        for spec in indices:
+            for col in ['_percentile','_trend','_fcast_percentile','_fcast_trend']:
+                detail_df[spec['field'] + col] = raws_df[spec['field'] + col].array
+        for rec in detail_df.to_dict('records'):
+            log.debug('..Station ' + str(rec['Station_ID']) + ', ' + str(rec['Station_Name']),
+                      extra={'data': rec})
+
+    return raws_df, raws2psa_df
+
+def compute_raws_incremental(raws_df, pra_df, fd_df, per_lookups, dates, udate, utime, threshold=3,
+                             prev=None, indices=DEFAULT_INDICES):
+    '''
+    Gives the same results as compute_raws, but only recomputes stations whose FEMS inputs (see
+    station_inputs) differ from the previous run. prev is the (raws_df, raws2psa_df) returned by
+    that run, which must have used the same percentile lookups and threshold; the other stations
+    keep their previous values, percentiles and trends. Without prev (or if prev doesn't have
+    every pair in indices) every station is computed.
+    '''
+    fields = result_fields(indices)
+    r2p_cols = [spec_key(spec) + col for spec in indices for col in PSA_INPUT_SUFFIXES]
+    if((prev is None) or (not set(fields) <= set(prev[0].columns)) or
+       (not set(r2p_cols) <= set(prev[1].columns))):
+        return compute_raws(raws_df,pra_df,fd_df,per_lookups,dates,udate,utime,threshold,indices)
+    prev_raws = prev[0].drop_duplicates('Station_ID').set_index('Station_ID')
+    prev_r2p = prev[1].drop_duplicates('Station_ID').set_index('Station_ID')
+
+    # Find stations that are new or whose inputs changed (missing values compare equal)
+    rvals_df = station_inputs(pivot_fems(fd_df),raws_df['Station_ID'],dates,indices)
+    changed = ~raws_df['Station_ID'].isin(prev_raws.index).to_numpy()
+    for col in rvals_df.columns:
+        new_vals = rvals_df[col].to_numpy(dtype='float64',na_value=numpy.nan)
+        old_vals = exact_float64(prev_r2p[col].reindex(raws_df['Station_ID']))
+        changed |= ~((new_vals == old_vals) | (numpy.isnan(new_vals) & numpy.isnan(old_vals)))
+    changed_ids = set(raws_df.loc[changed,'Station_ID'])
+    log.info('.Recomputing ' + str(len(changed_ids)) + ' of ' + str(raws_df.shape[0]) +
+             ' stations with new or changed inputs')
+
+    # Recompute changed stations
+    new_raws, new_r2p = compute_raws(raws_df.loc[changed],pra_df.loc[pra_df['Station_ID'].isin(changed_ids)],
+                                     fd_df,per_lookups,dates,udate,utime,threshold,indices)
+
+    # Keep previous results for the other stations
+    keep = raws_df.loc[~changed].copy()
+    for col in fields:
+        keep[col] = prev_raws[col].reindex(keep['Station_ID']).array
+    keep['update_date'] = udate
+    keep['update_time'] = utime
+    out_df = pandas.concat([keep,new_raws]).reindex(raws_df.index)
+    for col in fields: # Keep the working dtypes if one side was empty
+        if(col.endswith('_trend')):
+            out_df[col] = out_df[col].astype(TREND_DTYPE)
+        else:
+            out_df[col] = value_array(out_df[col])
+
+    # Merge the values needed for the PSA analysis the same way
+    raws2psa_df = pra_df[['Station_ID','Station_Name']].drop_duplicates().reset_index(drop=True)
+    raws2psa_df['Station_Name'] = raws2psa_df['Station_Name'].astype('category')
+    upd = raws2psa_df['Station_ID'].isin(changed_ids).to_numpy()
+    new_r2p = new_r2p.drop_duplicates('Station_ID').set_index('Station_ID')
+    for col in r2p_cols:
+        old_vals = exact_float64(prev_r2p[col].reindex(raws2psa_df['Station_ID']))
+        new_vals = exact_float64(new_r2p[col].reindex(raws2psa_df['Station_ID']))
+        raws2psa_df[col] = pandas.array(numpy.where(upd,new_vals,old_vals),dtype=VALUE_DTYPE)
+    return out_df, raws2psa_df
@@ -0,0 +1,61 @@
+'''
+Working dtypes of the FEMS, RAWS, PSA and per-station analysis frames. Index values and
+percentiles are kept as nullable Float64 (so values come back exactly as written in FEMS or the
+Percentiles table), trends and repeated labels as categoricals, so frames hold no per-cell Python
+objects. Values are converted back to plain floats, strings and None only when they are sent to
+the service or compared with it (service_frame).
+'''
+
+# Import libraries and modules
+import pandas, numpy
+from .indices import FEMS_INDEX_FIELDS
+from .trends import TREND_LABELS
+
+# Dtypes of the working frame columns
+VALUE_DTYPE = 'Float64'
+TREND_DTYPE = pandas.CategoricalDtype(TREND_LABELS)
+
+# Repeated FEMS labels stored as categoricals (dates stay strings for range selection)
+FEMS_CATEGORY_FIELDS = ['nfdr_type','fuel_model']
+
+def exact_float64(values):
+    '''
+    Returns values as a float64 array with NaN for missing values.
+    '''
+    return pandas.to_numeric(pandas.Series(values),errors='coerce').to_numpy(dtype='float64',na_value=numpy.nan)
+
+def value_array(values):
+    '''
+    Returns index values or percentiles as a nullable Float64 array.
+    '''
+    values = pandas.Series(values)
+    if(str(values.dtype) == VALUE_DTYPE):
+        return values.array
+    return pandas.array(exact_float64(values),dtype=VALUE_DTYPE)
+
+def compact_fems(fd_df):
+    '''
+    Returns the FEMS records (with the columns renamed, see fems.FEMS_COLUMNS) with Float64 index
+    values and categorical record types and fuel models.
+    '''
+    fd_df = fd_df.copy()
+    for col in fd_df.columns:
+        if(col in FEMS_INDEX_FIELDS):
+            fd_df[col] = value_array(fd_df[col])
+        elif(col in FEMS_CATEGORY_FIELDS):
+            fd_df[col] = fd_df[col].astype('category')
+    return fd_df
+
+def service_frame(df):
+    '''
+    Returns a copy of a working frame with plain Python values, as sent to the service: float
+    columns as float, categoricals as their labels and every missing value as None.
+    '''
+    out = {}
+    for col in df.columns:
+        vals = df[col]
+        if(str(vals.dtype) in ['Float64','Float32','float32']):
+            vals = pandas.Series(exact_float64(vals),index=df.index)
+        vals = vals.astype(object)
+        out[col] = vals.where(vals.notna(),None)
+    return pandas.DataFrame(out,index=df.index,columns=df.columns)
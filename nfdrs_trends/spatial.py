@@ -0,0 +1,199 @@
+'''
+Spatial PSA membership: derives the station-to-PSA associations from the RAWS locations and PSA
+boundaries instead of the hand-maintained PSA_RAWS_Associations table, so new stations and
+boundary changes are picked up on the next run. Both inputs are GeoJSON files in longitude and
+latitude (e.g. the RAWS locations and PSA boundaries listed in the README):
+
+- raws_locations: points with Station_ID and Station_Name properties
+- psa_boundaries: polygons with a PSANationalCode property
+
+Stations are matched to PSAs with point-in-polygon tests against an STRtree index of the
+boundaries. The index and the memberships are cached under cache_dir and rebuilt only when an
+input file changes. Stations outside every PSA are 'Non-PSA', and a station on a shared boundary
+belongs to both PSAs.
+
+Station values can also be weighted in the PSA means: 'distance' weights each station by the
+inverse of its distance to the PSA centroid, and 'area' by the share of the PSA area nearest to
+it (its Thiessen polygon clipped to the PSA). Weights are computed on a sinusoidal (equal-area)
+projection. Needs the shapely package.
+'''
+
+# Import libraries and modules
+import os, json, pickle, hashlib, logging, pandas, numpy
+from .metrics import metrics
+
+log = logging.getLogger(__name__)
+
+# Smallest distance used for inverse distance weights, in degrees (about 1 km)
+MIN_DISTANCE = 0.01
+
+def file_fingerprint(*paths):
+    '''
+    Returns a hash of the paths, sizes and modified times of the input files.
+    '''
+    digest = hashlib.sha1()
+    for path in paths:
+        info = os.stat(path)
+        digest.update((os.path.abspath(path) + '|' + str(info.st_size) + '|' + str(info.st_mtime_ns)).encode())
+    return digest.hexdigest()
+
+def read_geojson(path, key):
+    '''
+    Returns the key property and geometry of every feature in a GeoJSON file, skipping features
+    without either, plus the properties of the kept features as a data frame.
+    '''
+    import shapely.geometry
+    with open(path) as gf:
+        features = json.load(gf)['features']
+    features = [feat for feat in features if (feat.get('geometry') is not None) and
+                (feat.get('properties',{}).get(key) is not None)]
+    props = pandas.DataFrame([feat['properties'] for feat in features])
+    geoms = numpy.array([shapely.geometry.shape(feat['geometry']) for feat in features],dtype=object)
+    return props[key].to_numpy(), geoms, props
+
+def sinusoidal(geoms):
+    '''
+    Projects longitude/latitude geometries to a sinusoidal (equal-area) projection in degrees.
+    '''
+    import shapely
+    return shapely.transform(geoms,lambda xy: numpy.column_stack([xy[:,0] * numpy.cos(numpy.radians(xy[:,1])),
+                                                                  xy[:,1]]))
+
+class PSAIndex:
+    '''
+    STRtree index of the PSA boundary polygons, with prepared polygons for fast point-in-polygon
+    tests.
+    '''
+    def __init__(self, codes, polygons):
+        import shapely
+        self.codes = numpy.asarray(codes)
+        self.polygons = numpy.asarray(polygons,dtype=object)
+        shapely.prepare(self.polygons)
+        self.tree = shapely.STRtree(self.polygons)
+
+    def locate(self, points):
+        '''
+        Returns the (point position, polygon position) pairs of points inside or on the edge of
+        a polygon.
+        '''
+        return self.tree.query(points,predicate='intersects')
+
+    def weights(self, points, pairs, weighting):
+        '''
+        Returns the weight of each (point, polygon) pair for the distance or area weighting, as
+        the point's share of the weights in its polygon.
+        '''
+        import shapely
+        pts = sinusoidal(points)
+        polys = sinusoidal(self.polygons)
+        if(weighting == 'distance'):
+            dist = shapely.distance(pts[pairs[0]],shapely.centroid(polys)[pairs[1]])
+            weights = 1 / numpy.maximum(dist,MIN_DISTANCE)
+        else:
+            weights = self.area_weights(pts,polys,pairs)
+        return weights / numpy.bincount(pairs[1],weights)[pairs[1]]
+
+    def area_weights(self, pts, polys, pairs):
+        '''
+        Returns the area of each point's Thiessen polygon within its polygon, split evenly
+        between points at the same spot. Points alone in their polygon (or whose cells can't be
+        built) get equal weights.
+        '''
+        import shapely
+        weights = numpy.ones(pairs.shape[1])
+        order = numpy.argsort(pairs[1],kind='stable')
+        bounds = numpy.flatnonzero(numpy.diff(pairs[1][order])) + 1
+        for members in numpy.split(order,bounds):
+            poly = pairs[1][members[0]]
+            coords, inverse = numpy.unique(shapely.get_coordinates(pts[pairs[0][members]]),axis=0,
+                                           return_inverse=True)
+            inverse = inverse.ravel()
+            if(len(coords) < 2):
+                continue
+            cells = shapely.get_parts(shapely.voronoi_polygons(shapely.multipoints(coords),
+                                                               extend_to=polys[poly],ordered=True))
+            areas = shapely.area(shapely.intersection(cells,polys[poly]))
+            if((len(areas) == len(coords)) and (areas.sum() > 0)):
+                weights[members] = areas[inverse] / numpy.bincount(inverse)[inverse]
+        return weights
+
+def load_psa_index(path, cache_dir=None):
+    '''
+    Returns the PSAIndex of the boundaries in path, from the cache under cache_dir if the file
+    hasn't changed since the index was built.
+    '''
+    token = file_fingerprint(path)
+    cache_path = None if cache_dir is None else os.path.join(cache_dir,'spatial','psa_index.pkl')
+    if((cache_path is not None) and os.path.exists(cache_path)):
+        with open(cache_path,'rb') as cf:
+            cached = pickle.load(cf)
+        if(cached['token'] == token):
+            log.info('.PSA boundary index loaded from cache')
+            return cached['index']
+    codes, polygons, props = read_geojson(path,'PSANationalCode')
+    index = PSAIndex(codes,polygons)
+    log.info('.PSA boundary index built for ' + str(len(codes)) + ' PSAs')
+    if(cache_path is not None):
+        try:
+            os.makedirs(os.path.dirname(cache_path),exist_ok=True)
+            with open(cache_path + '.tmp','wb') as cf:
+                pickle.dump({'token': token,'index': index},cf)
+            os.replace(cache_path + '.tmp',cache_path)
+        except Exception:
+            pass # Cache is optional, continue with the built index
+    return index
+
+def spatial_associations(config, pra_df=None):
+    '''
+    Returns PSA_RAWS_Associations-style rows (Station_ID, Station_Name, PSA and, with a
+    psa_weighting setting, Weight) derived from the raws_locations and psa_boundaries files.
+    Memberships are cached under cache_dir and reused while both files and the weighting are
+    unchanged. Station names missing from the locations are taken from pra_df if given.
+    '''
+    locations, boundaries = config['raws_locations'], config['psa_boundaries']
+    weighting = config['psa_weighting']
+    cache_dir = config['cache_dir']
+    with metrics.timed('PSA memberships'):
+        token = file_fingerprint(locations,boundaries) + '|' + str(weighting)
+        cache_path = None if cache_dir is None else os.path.join(cache_dir,'spatial','memberships.pkl')
+        if((cache_path is not None) and os.path.exists(cache_path)):
+            with open(cache_path,'rb') as cf:
+                cached = pickle.load(cf)
+            if(cached['token'] == token):
+                log.info('.PSA memberships loaded from cache')
+                return cached['memberships']
+
+        # Point-in-polygon test of every station against the indexed boundaries
+        index = load_psa_index(boundaries,cache_dir)
+        sids, points, props = read_geojson(locations,'Station_ID')
+        pairs = index.locate(points)
+        memberships = pandas.DataFrame({'Station_ID': sids[pairs[0]],'PSA': index.codes[pairs[1]]})
+        if(weighting is not None):
+            memberships['Weight'] = index.weights(points,pairs,weighting)
+        outside = numpy.setdiff1d(numpy.arange(len(sids)),pairs[0])
+        memberships = pandas.concat([memberships,pandas.DataFrame({'Station_ID': sids[outside],
+                                                                   'PSA': 'Non-PSA'})],ignore_index=True)
+        if(weighting is not None):
+            memberships['Weight'] = memberships['Weight'].fillna(1.0)
+
+        # Station names from the locations, or the associations table where missing
+        names = pandas.Series(props['Station_Name'].to_numpy() if 'Station_Name' in props.columns
+                              else None,index=sids)
+        if(pra_df is not None):
+            names = names.fillna(pra_df.drop_duplicates('Station_ID').set_index('Station_ID')['Station_Name'])
+        names = names.loc[~names.index.duplicated()]
+        memberships.insert(1,'Station_Name',names.reindex(memberships['Station_ID']).to_numpy())
+        memberships = memberships.sort_values(['Station_ID','PSA'],kind='stable').reset_index(drop=True)
+        log.info('.PSA memberships derived for ' + str(len(sids)) + ' stations: ' +
+                 str(int((memberships['PSA'] != 'Non-PSA').sum())) + ' station/PSA pairs, ' +
+                 str(len(outside)) + ' stations outside every PSA')
+
+        if(cache_path is not None):
+            try:
+                os.makedirs(os.path.dirname(cache_path),exist_ok=True)
+                with open(cache_path + '.tmp','wb') as cf:
+                    pickle.dump({'token': token,'memberships': memberships},cf)
+                os.replace(cache_path + '.tmp',cache_path)
+            except Exception:
+                pass # Cache is optional, continue with the derived memberships
+    return memberships
@@ -0,0 +1,179 @@
+'''
+Rolling local store for incremental updates: the last days of FEMS nfdrMinMax records and the
+previous run's RAWS results. With the store, a daily run only requests the observation days
+no station has an observation ('O') record for yet plus the forecast days, and only recomputes
+stations whose inputs changed (see raws.compute_raws_incremental).
+
+Stations missing an observation for an earlier stored day (e.g. RAWS data that reach FEMS late,
+or a forecast record stored before the day was observed) are requested again for those days on
+every run until their observations arrive.
+'''
+
+# Import libraries and modules
+import os, json, hashlib, logging, importlib.util, pandas
+from datetime import datetime, timedelta
+from .indices import DEFAULT_INDICES, fuel_models
+from .fems import fetch_fems_data
+from .schema import compact_fems
+
+log = logging.getLogger(__name__)
+
+def lookup_fingerprint(per_lookups):
+    '''
+    Returns a hash of the compiled percentile lookups, so stored results are only reused with the
+    percentile tables they were computed from.
+    '''
+    digest = hashlib.sha1()
+    for comp in sorted(per_lookups):
+        for name in sorted(per_lookups[comp]):
+            digest.update(comp.encode() + name.encode())
+            digest.update(per_lookups[comp][name].tobytes())
+    return digest.hexdigest()
+
+class RollingStore:
+    '''
+    Store under path keeping keep_days days of FEMS records before the update date. Frames are
+    saved as Parquet when pyarrow is available and as pickles if not. With path None the store is
+    only kept in memory (e.g. by the refresh service).
+    '''
+    def __init__(self, path, keep_days=10):
+        self.path = path
+        self.keep_days = keep_days
+        self.ext = '.parquet' if importlib.util.find_spec('pyarrow') is not None else '.pkl'
+        self.meta = {}
+        self.prev = None
+        if((path is not None) and os.path.exists(os.path.join(path,'store.json'))):
+            with open(os.path.join(path,'store.json')) as mf:
+                self.meta = json.load(mf)
+        self.fd_df = self.read('fems')
+
+    def read(self, name):
+        '''
+        Returns a stored frame, or None if it isn't in the store.
+        '''
+        if(self.path is None):
+            return None
+        path = os.path.join(self.path,name + self.ext)
+        if(not os.path.exists(path)):
+            return None
+        if(self.ext == '.parquet'):
+            return pandas.read_parquet(path)
+        return pandas.read_pickle(path)
+
+    def write(self, name, df):
+        path = os.path.join(self.path,name + self.ext)
+        if(self.ext == '.parquet'):
+            df.to_parquet(path + '.tmp',index=False)
+        else:
+            df.to_pickle(path + '.tmp')
+        os.replace(path + '.tmp',path)
+
+    def missing_observations(self, days, station_ids, indices):
+        '''
+        Returns the station_ids without a stored observation ('O') record for every fuel model in
+        indices, for each of days.
+        '''
+        models = fuel_models(indices)
+        obs = self.fd_df.loc[(self.fd_df['nfdr_type'] == 'O') & self.fd_df['date'].isin(days) &
+                             self.fd_df['fuel_model'].isin(models),['station_id','date','fuel_model']]
+        n_models = obs.drop_duplicates().groupby(['date','station_id'],observed=True).size()
+        observed = n_models.loc[n_models == len(models)]
+        return {day: set(station_ids) - set(observed.loc[day].index if day in observed.index else [])
+                for day in days}
+
+    def fetch(self, config, dates, station_ids):
+        '''
+        Returns FEMS records for the observation and forecast window in dates (see fems_dates).
+        Observation days from the first day without any stored observations are downloaded with
+        the forecast days, and stations missing a stored observation on an earlier day are
+        downloaded again for those days. Every day is downloaded if the store is empty or was
+        filled for other fuel model and index pairs.
+        '''
+        station_ids = sorted(set(station_ids))
+        start = datetime.strptime(dates['o_sdate'],'%Y-%m-%d')
+        obs_days = [(start + timedelta(days=i)).strftime('%Y-%m-%d') for i in range(0,3)]
+        sdate = dates['o_sdate']
+        late = {}
+        if((self.fd_df is not None) and (self.meta.get('indices',DEFAULT_INDICES) == config['indices'])):
+            missing = self.missing_observations(obs_days,station_ids,config['indices'])
+            sdate = dates['f_sdate']
+            for day in obs_days:
+                if(len(missing[day]) == len(station_ids)):
+                    sdate = day
+                    break
+            late = {day: sids for day, sids in missing.items() if (day < sdate) and (len(sids) > 0)}
+        else:
+            self.fd_df = None # Refill the store
+
+        # Download stations still missing observations on earlier days and replace their records
+        if(len(late) > 0):
+            rdate = min(late)
+            late_ids = sorted(set().union(*late.values()))
+            rend = (datetime.strptime(sdate,'%Y-%m-%d') - timedelta(days=1)).strftime('%Y-%m-%d')
+            log.info('..Requesting ' + str(len(late_ids)) + ' stations missing observations from ' +
+                     rdate + ' to ' + rend)
+            fd_late = fetch_fems_data(config,rdate,rend,late_ids)
+            fd_late = fd_late.loc[fd_late['station_id'].isin(late_ids)]
+            replaced = (self.fd_df['date'] >= rdate) & (self.fd_df['date'] < sdate) & \
+                self.fd_df['station_id'].isin(late_ids)
+            self.fd_df = compact_fems(pandas.concat([self.fd_df.loc[~replaced],fd_late],ignore_index=True))
+
+        # Download the new days and replace any stored records for them
+        fd_new = fetch_fems_data(config,sdate,dates['f_edate'],station_ids)
+        if(sdate > dates['o_sdate']):
+            fd_old = self.fd_df.loc[(self.fd_df['date'] >= dates['o_sdate']) & (self.fd_df['date'] < sdate)]
+            log.info('..Reused ' + str(fd_old.shape[0]) + ' stored records from ' + dates['o_sdate'] +
+                     ' to ' + (datetime.strptime(sdate,'%Y-%m-%d') - timedelta(days=1)).strftime('%Y-%m-%d'))
+            fd_all = compact_fems(pandas.concat([fd_old,fd_new],ignore_index=True))
+        else:
+            fd_all = fd_new
+        if(self.fd_df is not None):
+            self.fd_df = compact_fems(pandas.concat([self.fd_df.loc[self.fd_df['date'] < sdate],fd_new],
+                                                    ignore_index=True))
+        else:
+            self.fd_df = fd_new
+        self.indices = config['indices']
+        return fd_all
+
+    def previous(self, per_lookups, threshold):
+        '''
+        Returns the (raws_df, raws2psa_df) saved by the previous run, or None if there is none or
+        it was computed with different percentile lookups or trend threshold.
+        '''
+        if((self.meta.get('lookups') != lookup_fingerprint(per_lookups)) or
+           (self.meta.get('threshold') != threshold)):
+            return None
+        if(self.prev is None):
+            raws_df = self.read('raws')
+            raws2psa_df = self.read('raws2psa')
+            if((raws_df is None) or (raws2psa_df is None)):
+                return None
+            self.prev = (raws_df,raws2psa_df)
+        return self.prev
+
+    def save(self, udate, raws_df, raws2psa_df, per_lookups, threshold):
+        '''
+        Saves the FEMS records (trimmed to keep_days before udate) and this run's RAWS results.
+        '''
+        first = (datetime.strptime(udate,'%Y-%m-%d') - timedelta(days=self.keep_days)).strftime('%Y-%m-%d')
+        self.fd_df = self.fd_df.loc[self.fd_df['date'] >= first].reset_index(drop=True)
+
+        self.prev = (raws_df,raws2psa_df)
+        self.meta = {'udate': udate,
+                     'indices': self.indices,
+                     'lookups': lookup_fingerprint(per_lookups),
+                     'threshold': threshold,
+                     'saved': datetime.now().isoformat(timespec='seconds')}
+        if(self.path is None):
+            return
+
+        # Write frames first and the metadata last, so an interrupted save isn't trusted
+        os.makedirs(self.path,exist_ok=True)
+        meta_path = os.path.join(self.path,'store.json')
+        if(os.path.exists(meta_path)):
+            os.remove(meta_path)
+        self.write('fems',self.fd_df)
+        self.write('raws',raws_df)
+        self.write('raws2psa',raws2psa_df)
+        with open(meta_path,'w') as mf:
+            json.dump(self.meta,mf)
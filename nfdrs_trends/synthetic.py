@@ -0,0 +1,232 @@
+'''
+Synthetic inputs shaped like the production data, for offline benchmarks and load tests:
+Percentiles breakpoint tables, PSA_RAWS_Associations, the RAWS and PSA target tables,
+nfdrMinMax GraphQL responses and RAWS location and PSA boundary GeoJSON files. Everything is
+generated from a seed, so runs are repeatable.
+'''
+
+# Import libraries and modules
+import os, io, re, json, pandas, numpy, requests
+from datetime import datetime, timedelta
+from .indices import FEMS_INDEX_FIELDS, DEFAULT_INDICES, fuel_models, components, result_fields
+from .fems import fems_dates, fems_fields
+
+# Typical upper end of each index, used to scale the synthetic breakpoints and values
+INDEX_MAX = {'ERC': 120,'BI': 250,'SC': 100,'IC': 100}
+
+# Geographic area prefixes for synthetic PSA codes
+GACC_PREFIXES = ['AK','CA','EA','GB','NO','NR','NW','RM','SA','SO','SW']
+
+def station_ids(n_stations, first=20000):
+    '''
+    Returns n_stations numeric FEMS-style station IDs.
+    '''
+    return numpy.arange(first,first + n_stations,dtype='int64')
+
+def make_percentiles(sids, breakpoints=100, rng=None, comps=['ERC','BI']):
+    '''
+    Builds a Percentiles table with breakpoints rows per station for each component in comps.
+    Each station gets its own increasing GreaterThanEqualTo/LessThan edges with Percentile
+    running from 100/breakpoints up to 100. The table has no Fuel_Model field, so its breakpoints
+    apply to every fuel model.
+    '''
+    rng = numpy.random.default_rng(0) if rng is None else rng
+    n = len(sids)
+    parts = []
+    for comp in comps:
+        top = INDEX_MAX[comp]
+        steps = rng.gamma(2.0,1.0,(n,breakpoints))
+        edges = numpy.cumsum(steps,axis=1)
+        edges = edges / edges[:,-1:] * rng.uniform(0.6,1.2,(n,1)) * top # Station climatology
+        edges = numpy.round(numpy.hstack([numpy.zeros((n,1)),edges]),2)
+        parts.append(pandas.DataFrame({
+            'Station_ID': numpy.repeat(sids,breakpoints),
+            'Component': comp,
+            'GreaterThanEqualTo': edges[:,:-1].ravel(),
+            'LessThan': edges[:,1:].ravel(),
+            'Percentile': numpy.tile(numpy.round(numpy.arange(1,breakpoints + 1) * 100 / breakpoints,2),n)}))
+    per_df = pandas.concat(parts,ignore_index=True)
+    per_df.insert(0,'OBJECTID',numpy.arange(1,per_df.shape[0] + 1))
+    return per_df
+
+def make_associations(sids, stations_per_psa=2.5, non_psa=0.05, shared=0.1, rng=None):
+    '''
+    Builds a PSA_RAWS_Associations table. Stations are spread over PSAs at about
+    stations_per_psa stations each; a share of stations is 'Non-PSA' and another share is also
+    associated with a second PSA.
+    '''
+    rng = numpy.random.default_rng(0) if rng is None else rng
+    n_psas = max(1,int(round(len(sids) / stations_per_psa)))
+    psas = numpy.array([GACC_PREFIXES[i % len(GACC_PREFIXES)] + str(i // len(GACC_PREFIXES) + 1).zfill(2)
+                        for i in range(0,n_psas)])
+    primary = psas[rng.integers(0,n_psas,len(sids))].astype(object) # Room for 'Non-PSA'
+    primary[rng.random(len(sids)) < non_psa] = 'Non-PSA'
+    extra = rng.random(len(sids)) < shared
+    pra_df = pandas.DataFrame({'Station_ID': numpy.concatenate([sids,sids[extra]]),
+                               'PSA': numpy.concatenate([primary,psas[rng.integers(0,n_psas,extra.sum())]])})
+    pra_df.insert(1,'Station_Name',['RAWS ' + str(sid) for sid in pra_df['Station_ID']])
+    pra_df.insert(0,'OBJECTID',numpy.arange(1,pra_df.shape[0] + 1))
+    return pra_df
+
+def make_target_tables(pra_df, indices=DEFAULT_INDICES):
+    '''
+    Builds empty RAWS_Percentiles_Trends and PSA_Percentiles_Trends tables with the result fields
+    of the pairs in indices, covering the stations and PSAs in pra_df, as they are read from the
+    service before a run.
+    '''
+    stations = pra_df[['Station_ID','Station_Name']].drop_duplicates('Station_ID')
+    raws_df = stations.reset_index(drop=True)
+    for col in result_fields(indices) + ['update_date','update_time']:
+        raws_df[col] = None
+    raws_df.insert(0,'OBJECTID',numpy.arange(1,raws_df.shape[0] + 1))
+    psa_df = pandas.DataFrame({'PSANationalCode': sorted(set(pra_df['PSA']) - {'Non-PSA'})})
+    for col in ['avg_' + field for field in result_fields(indices)] + ['update_date','update_time']:
+        psa_df[col] = None
+    psa_df.insert(0,'OBJECTID',numpy.arange(1,psa_df.shape[0] + 1))
+    return raws_df, psa_df
+
+def make_spatial_inputs(pra_df, out_dir, rng=None):
+    '''
+    Writes RAWS location points (raws_locations.geojson) and PSA boundary polygons
+    (psa_boundaries.geojson) matching pra_df to out_dir for the spatial PSA membership (see
+    spatial). PSAs are 1 degree cells on a grid over the western US and each station is placed
+    at random in the cell of its first PSA, or south of the grid if it is 'Non-PSA'. Returns the
+    two paths.
+    '''
+    rng = numpy.random.default_rng(0) if rng is None else rng
+    psas = sorted(set(pra_df['PSA']) - {'Non-PSA'})
+    cols = max(1,int(numpy.ceil(numpy.sqrt(len(psas)))))
+    cells = {psa: (-125 + (i % cols),30 + (i // cols)) for i, psa in enumerate(psas)}
+    boundaries = [{'type': 'Feature','properties': {'PSANationalCode': psa},
+                   'geometry': {'type': 'Polygon','coordinates': [[[x,y],[x + 1,y],[x + 1,y + 1],[x,y + 1],[x,y]]]}}
+                  for psa, (x, y) in cells.items()]
+    stations = pra_df.drop_duplicates('Station_ID')
+    offsets = rng.uniform(0.02,0.98,(stations.shape[0],2))
+    locations = []
+    for (sid, name, psa), (dx, dy) in zip(stations[['Station_ID','Station_Name','PSA']].itertuples(index=False),
+                                          offsets):
+        x, y = cells.get(psa,(-125,28))
+        locations.append({'type': 'Feature','properties': {'Station_ID': int(sid),'Station_Name': name},
+                          'geometry': {'type': 'Point','coordinates': [round(x + dx * cols if psa == 'Non-PSA' else x + dx,5),
+                                                                       round(y + dy,5)]}})
+    paths = []
+    for name, features in [('raws_locations',locations),('psa_boundaries',boundaries)]:
+        paths.append(os.path.join(out_dir,name + '.geojson'))
+        with open(paths[-1],'w') as gf:
+            json.dump({'type': 'FeatureCollection','features': features},gf)
+    return paths[0], paths[1]
+
+def make_fems_records(sids, udate, missing=0.05, rng=None, last_date=None, indices=DEFAULT_INDICES):
+    '''
+    Builds nfdrMinMax records for every station, fuel model and day of the observation and
+    forecast window around udate (or from udate's window through last_date's for a range of
+    update dates), with observed ('O') records before udate and forecast ('F') records from
+    udate, and the index fields of the pairs in indices. A share of station/days is left out and
+    a share of ERC values is null, as in FEMS.
+    '''
+    rng = numpy.random.default_rng(0) if rng is None else rng
+    start = datetime.strptime(fems_dates(udate)['o_sdate'],'%Y-%m-%d')
+    end = datetime.strptime(fems_dates(last_date or udate)['f_edate'],'%Y-%m-%d')
+    days = [(start + timedelta(days=i)).strftime('%Y-%m-%d') for i in range(0,(end - start).days + 1)]
+    n = len(sids)
+
+    # Each station wanders around its own typical level so trends have a realistic spread
+    parts = []
+    for model in fuel_models(indices):
+        records = {'station_id': numpy.repeat(sids,len(days)),
+                   'summary_date': numpy.tile(days,n),
+                   'nfdr_type': numpy.tile(['O' if day < udate else 'F' for day in days],n),
+                   'fuel_model': model}
+        for comp in components(indices):
+            level = rng.uniform(0.1,0.9,(n,1)) * INDEX_MAX[comp]
+            walk = numpy.cumsum(rng.normal(0,0.04 * INDEX_MAX[comp],(n,len(days))),axis=1)
+            records[FEMS_INDEX_FIELDS[comp]] = numpy.round(numpy.clip(level + walk,0,None),0).ravel()
+        parts.append(pandas.DataFrame(records,columns=fems_fields(indices)))
+    fems_df = pandas.concat(parts,ignore_index=True)
+    if('energy_release_component_max' in fems_df.columns):
+        fems_df['energy_release_component_max'] = fems_df['energy_release_component_max'].astype(object)
+        fems_df.loc[rng.random(fems_df.shape[0]) < missing / 2,'energy_release_component_max'] = None
+    fems_df = fems_df.loc[rng.random(fems_df.shape[0]) >= missing].reset_index(drop=True)
+    return fems_df
+
+def make_fixtures(n_stations, udate='2025-09-11', breakpoints=100, stations_per_psa=2.5,
+                  missing=0.05, seed=0, last_date=None, indices=DEFAULT_INDICES):
+    '''
+    Returns a full set of synthetic inputs for n_stations stations and the fuel model and index
+    pairs in indices: per_df, pra_df, raws_df, psa_df and fems_df (nfdrMinMax records with the
+    FEMS field names). FEMS records cover the windows of every update date from udate through
+    last_date (if given).
+    '''
+    rng = numpy.random.default_rng(seed)
+    sids = station_ids(n_stations)
+    pra_df = make_associations(sids,stations_per_psa,rng=rng)
+    raws_df, psa_df = make_target_tables(pra_df,indices)
+    return {'per_df': make_percentiles(sids,breakpoints,rng,components(indices)),
+            'pra_df': pra_df,
+            'raws_df': raws_df,
+            'psa_df': psa_df,
+            'fems_df': make_fems_records(sids,udate,missing,rng,last_date,indices)}
+
+def fems_response(fems_df, sdate=None, edate=None, station_ids='', page=None, per_page=None,
+                  models=''):
+    '''
+    Returns the JSON body FEMS would send for an nfdrMinMax query over fems_df: records in the
+    date window for the comma-separated station list (all stations if empty) and fuel models
+    (all if empty), limited to one page when page and per_page are given, with the _metadata
+    block.
+    '''
+    recs = fems_df
+    if(models):
+        recs = recs.loc[recs['fuel_model'].isin(models.split(','))]
+    if(sdate is not None):
+        recs = recs.loc[(recs['summary_date'] >= sdate) & (recs['summary_date'] <= edate)]
+    if(station_ids):
+        recs = recs.loc[recs['station_id'].isin([int(sid) for sid in station_ids.split(',')])]
+    total = recs.shape[0]
+    if(page is None):
+        page, per_page, page_count = 1, total, 1
+    else:
+        page_count = max(1,-(-total // per_page))
+        recs = recs.iloc[(page - 1) * per_page:page * per_page]
+    recs = recs.astype(object).where(recs.notna(),None)
+    body = {'data': {'nfdrMinMax': {'_metadata': {'page': page,'per_page': per_page,
+                                                  'total_count': total,'page_count': page_count},
+                                    'data': recs.to_dict('records')}}}
+    return json.dumps(body).encode()
+
+def parse_query(query):
+    '''
+    Pulls the window, station list, fuel models and paging out of an nfdrMinMax query built by
+    fems_query.
+    '''
+    args = dict(re.findall(r'(\w+): "([^"]*)"',query))
+    paging = re.search(r'page: (\d+)\s+per_page: (\d+)',query)
+    return {'sdate': args.get('startDate'),
+            'edate': args.get('endDate'),
+            'station_ids': args.get('stationIds',''),
+            'models': args.get('fuelModels',''),
+            'page': int(paging.group(1)) if paging else None,
+            'per_page': int(paging.group(2)) if paging else None}
+
+class FixtureSession:
+    '''
+    Offline stand-in for the requests session used by the FEMS fetch functions. Answers
+    nfdrMinMax queries from synthetic records and keeps each response body, so repeated runs
+    measure parsing rather than fixture encoding.
+    '''
+    def __init__(self, fems_df):
+        self.fems_df = fems_df
+        self.bodies = {}
+
+    def post(self, url, json=None, stream=False, **kwargs):
+        query = json['query']
+        if(query not in self.bodies):
+            self.bodies[query] = fems_response(self.fems_df,**parse_query(query))
+        response = requests.models.Response()
+        response.status_code = 200
+        response.url = url
+        response.raw = io.BytesIO(self.bodies[query])
+        return response
+
+    def close(self):
+        pass
@@ -0,0 +1,33 @@
+'''
+Trend classification shared by the RAWS and PSA stages.
+'''
+
+# Import libraries and modules
+import pandas, numpy
+
+# Trend classes, in the order used for categorical trend columns
+TREND_LABELS = ['Increase','Decrease','No Change']
+
+def classify_trends(start, end, threshold=3):
+    '''
+    Classifies the change from start to end for every station or PSA at once as Increase
+    (>= +threshold), Decrease (<= -threshold) or No Change. Returns a categorical array that is
+    NA wherever either value is missing.
+    '''
+    start = pandas.to_numeric(pandas.Series(start),errors='coerce').to_numpy(dtype='float64',
+                                                                              na_value=numpy.nan)
+    end = pandas.to_numeric(pandas.Series(end),errors='coerce').to_numpy(dtype='float64',
+                                                                          na_value=numpy.nan)
+    es_diff = end - start
+    codes = numpy.select([es_diff >= threshold,es_diff <= -threshold,numpy.abs(es_diff) < threshold],
+                         [0,1,2],default=-1) # NaN differences fail every test and stay -1 (NA)
+    return pandas.Categorical.from_codes(codes,categories=TREND_LABELS)
+
+def trend_summary(trends):
+    '''
+    Counts each trend class for the log, e.g. '3 Increase, 1 Decrease, 10 No Change, 2 missing'.
+    '''
+    trends = pandas.Series(trends)
+    counts = trends.value_counts()
+    return ', '.join([str(int(counts.get(label,0))) + ' ' + label for label in TREND_LABELS] +
+                     [str(int(trends.isna().sum())) + ' missing'])
@@ -0,0 +1,23 @@
+'''
+Setup shared by the worker process pools of the backfill and the Percentiles table rebuild.
+'''
+
+# Import libraries and modules
+import logging
+
+# Inputs shared by every task, set once per worker process by init_worker
+shared = {}
+
+def init_worker(inputs, setup=None):
+    '''
+    Sets up a worker process: stores inputs (a dict) in shared for every task it runs and then
+    calls setup, if given, to finish loading them (e.g. memory-mapping files).
+    '''
+    # The parent's log queue isn't read in worker processes, so only report problems
+    worker_log = logging.getLogger('nfdrs_trends')
+    worker_log.handlers = []
+    worker_log.setLevel(logging.WARNING)
+    shared.clear()
+    shared.update(inputs)
+    if(setup is not None):
+        setup()
@@ -0,0 +1,105 @@
+'''
+Checks the changed-row selection and chunk upload retries of the publish stage, and loading the
+percentile lookups when the cache can't be written.
+'''
+
+# Import libraries and modules
+import json, types, logging, numpy, pandas, requests
+from nfdrs_trends.agol import RestTable, changed_rows, upload_chunk, upload_tables, load_percentile_lookups
+from nfdrs_trends.percentiles import build_percentile_lookups
+from nfdrs_trends.synthetic import make_fixtures
+
+class FakeResponse:
+    def __init__(self, status, body):
+        self.status_code = status
+        self.body = body
+
+    def raise_for_status(self):
+        if(self.status_code >= 400):
+            raise requests.HTTPError(str(self.status_code))
+
+    def json(self):
+        return self.body
+
+    @property
+    def text(self):
+        return json.dumps(self.body)
+
+class FakeSession:
+    '''
+    Answers applyEdits posts with the scripted responses in turn, recording the features sent,
+    for a table whose object ID field is key. A response of None reports every feature sent as
+    successful.
+    '''
+    def __init__(self, responses, key='OBJECTID'):
+        self.responses = list(responses)
+        self.key = key
+        self.sent = []
+
+    def get(self, url, params):
+        return FakeResponse(200,{'name': 'RAWS_Percentiles_Trends','objectIdField': self.key})
+
+    def post(self, url, data):
+        features = json.loads(data['updates'])
+        self.sent.append(sorted([feat['attributes'][self.key] for feat in features]))
+        status, body = self.responses.pop(0)
+        if(body is None):
+            body = {'updateResults': [{'objectId': feat['attributes'][self.key],'success': True}
+                                      for feat in features]}
+        return FakeResponse(status,body)
+
+def chunk(key='OBJECTID'):
+    return pandas.DataFrame({key: [1,2,3],'erc': [10.0,None,30.0],'erc_trend': ['Increase',None,'No Change']})
+
+def test_changed_rows():
+    old_df = chunk()
+    new_df = chunk()
+    new_df.loc[0,'erc'] = 11.0 # Changed value
+    new_df.loc[1,'update_date'] = '2025-09-11' # Only the update date differs
+    old_df['update_date'] = None
+    new_df = pandas.concat([new_df,pandas.DataFrame({'OBJECTID': [4],'erc': [40.0]})],ignore_index=True) # New row
+    assert changed_rows(new_df,old_df)['OBJECTID'].tolist() == [1,2,4]
+    assert changed_rows(new_df,old_df,ignore=['update_date'])['OBJECTID'].tolist() == [1,4]
+    renamed = changed_rows(new_df.rename(columns={'OBJECTID': 'FID'}),old_df.rename(columns={'OBJECTID': 'FID'}),'FID')
+    assert renamed['FID'].tolist() == [1,2,4]
+
+def test_upload_chunk_resends_rejected_rows():
+    session = FakeSession([(200,{'updateResults': [{'objectId': 1,'success': True},
+                                                   {'objectId': 2,'success': False},
+                                                   {'objectId': 3,'success': False}]}),
+                           (200,{'updateResults': [{'objectId': 2,'success': True}]}), # 3 not reported
+                           (200,None)])
+    assert upload_chunk(RestTable('http://service/0',session),chunk(),backoff=0) == []
+    assert session.sent == [[1,2,3],[2,3],[3]]
+
+def test_upload_chunk_resends_whole_chunk_on_failed_requests():
+    session = FakeSession([(503,{}),
+                           (200,{'error': {'code': 500,'message': 'Unable to complete operation.'}}),
+                           (200,{}), # No updateResults
+                           (200,None)])
+    assert upload_chunk(RestTable('http://service/0',session),chunk(),backoff=0) == []
+    assert session.sent == [[1,2,3]] * 4
+
+def test_upload_chunk_returns_rows_that_never_succeed():
+    session = FakeSession([(200,{'updateResults': [{'objectId': 1,'success': True}]})] + [(503,{})] * 2)
+    assert upload_chunk(RestTable('http://service/0',session),chunk(),attempts=3,backoff=0) == [2,3]
+
+def test_upload_uses_table_object_id_field():
+    session = FakeSession([(200,{'updateResults': [{'objectId': 1,'success': True}]}),(200,None)],'ObjectId')
+    failed = upload_tables([('RAWS',RestTable('http://service/0',session),chunk('ObjectId'))],backoff=0)
+    assert failed == {'RAWS': []}
+    assert session.sent == [[1,2,3],[2,3]]
+
+def test_percentile_lookups_with_unwritable_cache(tmp_path, caplog):
+    per_df = make_fixtures(20)['per_df']
+    cache_dir = tmp_path / 'cache'
+    cache_dir.write_text('') # A file, so nothing can be written under it
+    table = types.SimpleNamespace(query=lambda: types.SimpleNamespace(df=per_df))
+    with caplog.at_level(logging.WARNING):
+        lookups = load_percentile_lookups(types.SimpleNamespace(modified=1),[table],str(cache_dir))
+    assert 'using them from memory' in caplog.text
+    expected = build_percentile_lookups(per_df)
+    assert list(lookups) == list(expected)
+    for comp in expected:
+        for name in expected[comp]:
+            numpy.testing.assert_array_equal(lookups[comp][name],expected[comp][name])
@@ -0,0 +1,59 @@
+'''
+Checks the rebuilt Percentiles table against numpy empirical percentiles of the observed values.
+'''
+
+# Import libraries and modules
+import numpy, pandas, pytest
+from nfdrs_trends.climatology import value_counts, merge_counts, percentile_table
+from nfdrs_trends.percentiles import build_percentile_lookups, lookup_percentiles
+
+INDICES = [{'fuel_model': 'Y','component': 'ERC','field': 'erc'}]
+
+# Observed ERC values by station, with ties, and a station with a single distinct value
+SERIES = {20001: [12,5,9,9,7,12,5,9,30,18,5,9],
+          20002: [40,40,40]}
+
+def fems_records(series):
+    '''
+    nfdrMinMax records for the series, plus forecast and missing values that must be skipped.
+    '''
+    rows = []
+    for sid, vals in series.items():
+        rows += [{'station_id': sid,'nfdr_type': 'O','fuel_model': 'Y','energy_release_component_max': val}
+                 for val in vals]
+        rows += [{'station_id': sid,'nfdr_type': 'F','fuel_model': 'Y','energy_release_component_max': 1000},
+                 {'station_id': sid,'nfdr_type': 'O','fuel_model': 'Y','energy_release_component_max': None}]
+    return pandas.DataFrame(rows)
+
+def ecdf(vals, values):
+    '''
+    Share of vals at or below each of values, in percent.
+    '''
+    return numpy.searchsorted(numpy.sort(vals),values,side='right') / len(vals) * 100
+
+@pytest.fixture
+def per_df():
+    fd_df = fems_records(SERIES)
+    half = fd_df.shape[0] // 2 # Counted in two windows and merged, as the rebuild does
+    counts = [value_counts(fd_df.iloc[:half],INDICES),value_counts(fd_df.iloc[half:],INDICES)]
+    return percentile_table({'Y_ERC': merge_counts([part['Y_ERC'] for part in counts])},INDICES,min_days=1)
+
+def test_breakpoints_match_empirical_percentiles(per_df):
+    rows = per_df.loc[per_df['Station_ID'] == 20001]
+    vals = numpy.array(SERIES[20001],dtype='float64')
+    distinct = numpy.unique(vals)
+    assert rows['GreaterThanEqualTo'].tolist() == distinct[:-1].tolist()
+    assert rows['LessThan'].tolist() == distinct[1:].tolist()
+    assert rows['Percentile'].tolist() == numpy.round(ecdf(vals,distinct[:-1]),2).tolist()
+    single = per_df.loc[per_df['Station_ID'] == 20002]
+    assert single[['GreaterThanEqualTo','LessThan','Percentile']].values.tolist() == [[40,40,100]]
+
+def test_lookups_match_empirical_percentiles(per_df):
+    lookup = build_percentile_lookups(per_df,INDICES)['Y_ERC']
+    for sid, vals in SERIES.items():
+        vals = numpy.array(vals,dtype='float64')
+        queries = numpy.concatenate([numpy.unique(vals),[vals.min() - 1,vals.max(),vals.max() + 5,
+                                                         vals.min() + 0.5,vals.max() - 0.5]])
+        expected = numpy.where(queries < vals.min(),0.01,numpy.round(ecdf(vals,queries),2))
+        got = lookup_percentiles(lookup,numpy.full(len(queries),sid),queries).to_numpy(dtype='float64')
+        assert got.tolist() == expected.tolist(), sid
@@ -0,0 +1,30 @@
+'''
+Checks the percentile lookups compiled from the Percentiles table.
+'''
+
+# Import libraries and modules
+import numpy, pandas
+from nfdrs_trends.percentiles import build_percentile_lookups, lookup_percentiles
+from nfdrs_trends.synthetic import make_fixtures
+
+INDICES = [{'fuel_model': 'Y','component': 'ERC','field': 'erc'},
+           {'fuel_model': 'V','component': 'ERC','field': 'erc_v'}]
+
+def test_table_without_fuel_model_is_fuel_model_y():
+    per_df = make_fixtures(20)['per_df']
+    assert 'Fuel_Model' not in per_df.columns
+    lookups = build_percentile_lookups(per_df,INDICES)
+    sids = per_df['Station_ID'].unique()
+    vals = numpy.full(len(sids),50.0)
+    assert pandas.notna(lookup_percentiles(lookups['Y_ERC'],sids,vals)).all()
+    assert len(lookups['V_ERC']['stations']) == 0
+    assert pandas.isna(lookup_percentiles(lookups['V_ERC'],sids,vals)).all()
+
+def test_table_with_fuel_model():
+    per_df = make_fixtures(20)['per_df']
+    per_df = pandas.concat([per_df.assign(Fuel_Model='Y'),per_df.assign(Fuel_Model='V',Percentile=1.0)],
+                           ignore_index=True)
+    lookups = build_percentile_lookups(per_df,INDICES)
+    assert len(lookups['V_ERC']['stations']) == per_df['Station_ID'].nunique()
+    assert (lookups['V_ERC']['percentiles'] == 1).all()
+    assert (lookups['Y_ERC']['percentiles'] != 1).any()
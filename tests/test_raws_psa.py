@@ -0,0 +1,129 @@
+'''
+Checks the vectorized RAWS and PSA stages against the per-station loop of the original script,
+on synthetic inputs.
+'''
+
+# Import libraries and modules
+import statistics, pandas, pytest
+from nfdrs_trends.fems import FEMS_COLUMNS, FEMS_KEY_DTYPES, fems_dates
+from nfdrs_trends.percentiles import build_percentile_lookups
+from nfdrs_trends.raws import compute_raws
+from nfdrs_trends.psa import aggregate_psa
+from nfdrs_trends.schema import compact_fems, service_frame
+from nfdrs_trends.synthetic import make_fixtures
+
+UDATE = '2025-09-11'
+COMPONENTS = [('ERC','erc'),('BI','bi')]
+
+def classify(start, end, threshold=3):
+    if(pandas.isnull(start) or pandas.isnull(end)):
+        return None
+    es_diff = end - start
+    if(es_diff >= threshold):
+        return 'Increase'
+    if(es_diff <= -threshold):
+        return 'Decrease'
+    return 'No Change'
+
+def percentile(per, value):
+    if(pandas.isnull(value)):
+        return None
+    if(value < min(per['GreaterThanEqualTo'])):
+        return 0.01
+    if(value >= max(per['LessThan'])):
+        return 100.00
+    return per.loc[(per['GreaterThanEqualTo'] <= value) & (per['LessThan'] > value)]['Percentile'].iloc[0]
+
+def baseline_raws(fx, dates):
+    '''
+    Per-station results and PSA inputs computed one station at a time, as the original script did.
+    '''
+    fd_df = fx['fems_df'].rename(columns=FEMS_COLUMNS)
+    results, inputs = {}, {}
+    for sid in fx['raws_df']['Station_ID']:
+        results[sid], inputs[sid] = {}, {}
+        for comp, field in COMPONENTS:
+            per = fx['per_df'].loc[(fx['per_df']['Station_ID'] == sid) & (fx['per_df']['Component'] == comp)]
+            vals = {}
+            for name in ['o_sdate','o_edate','f_sdate','f_edate']:
+                rows = fd_df.loc[(fd_df['station_id'] == sid) & (fd_df['date'] == dates[name]),comp]
+                vals[name] = None if (rows.shape[0] == 0) or pandas.isnull(rows.iloc[0]) else float(rows.iloc[0])
+            results[sid].update({field: vals['o_edate'],
+                                 field + '_percentile': percentile(per,vals['o_edate']),
+                                 field + '_trend': classify(vals['o_sdate'],vals['o_edate']),
+                                 field + '_fcast': vals['f_sdate'],
+                                 field + '_fcast_percentile': percentile(per,vals['f_sdate']),
+                                 field + '_fcast_trend': classify(vals['f_sdate'],vals['f_edate'])})
+            inputs[sid].update({comp + '_obs_per': results[sid][field + '_percentile'],
+                                comp + '_obs_start': vals['o_sdate'],
+                                comp + '_obs_end': vals['o_edate'],
+                                comp + '_fcast_per': results[sid][field + '_fcast_percentile'],
+                                comp + '_fcast_start': vals['f_sdate'],
+                                comp + '_fcast_end': vals['f_edate']})
+    return results, inputs
+
+def baseline_psa(fx, inputs):
+    '''
+    PSA means and trends computed one PSA at a time, as the original script did.
+    '''
+    results = {}
+    pra_df = fx['pra_df']
+    for psa in sorted(set(pra_df['PSA'].tolist()) - {'Non-PSA'}):
+        stations = pra_df.loc[pra_df['PSA'] == psa,'Station_ID'].tolist()
+        results[psa] = {}
+        for comp, field in COMPONENTS:
+            means = {}
+            for col in ['_obs_per','_obs_start','_obs_end','_fcast_per','_fcast_start','_fcast_end']:
+                vals = [inputs[sid][comp + col] for sid in dict.fromkeys(stations)
+                        if inputs[sid][comp + col] is not None]
+                means[col] = round(statistics.mean(vals),2) if len(vals) > 0 else None
+            results[psa].update({'avg_' + field: means['_obs_end'],
+                                 'avg_' + field + '_percentile': means['_obs_per'],
+                                 'avg_' + field + '_trend': classify(means['_obs_start'],means['_obs_end']),
+                                 'avg_' + field + '_fcast': means['_fcast_start'],
+                                 'avg_' + field + '_fcast_percentile': means['_fcast_per'],
+                                 'avg_' + field + '_fcast_trend': classify(means['_fcast_start'],
+                                                                           means['_fcast_end'])})
+    return results
+
+def assert_rows_match(out_df, key, expected):
+    out = service_frame(out_df).set_index(key)
+    for kval, fields in expected.items():
+        for field, value in fields.items():
+            got = out.loc[kval,field]
+            if(isinstance(value,float) and (got is not None)):
+                assert got == pytest.approx(value,abs=1e-9), (kval,field)
+            else:
+                assert got == value, (kval,field)
+
+@pytest.fixture(scope='module')
+def fixtures():
+    return make_fixtures(300,udate=UDATE)
+
+@pytest.fixture(scope='module')
+def results(fixtures):
+    dates = fems_dates(UDATE)
+    fd_df = compact_fems(fixtures['fems_df'].astype(FEMS_KEY_DTYPES).rename(columns=FEMS_COLUMNS))
+    return compute_raws(fixtures['raws_df'],fixtures['pra_df'],fd_df,build_percentile_lookups(fixtures['per_df']),
+                        dates,UDATE,'0200')
+
+def test_raws_matches_baseline(fixtures, results):
+    expected = baseline_raws(fixtures,fems_dates(UDATE))[0]
+    assert_rows_match(results[0],'Station_ID',expected)
+    assert (results[0]['update_date'] == UDATE).all()
+
+def test_psa_matches_baseline(fixtures, results):
+    expected = baseline_psa(fixtures,baseline_raws(fixtures,fems_dates(UDATE))[1])
+    psa_df = aggregate_psa(fixtures['psa_df'],fixtures['pra_df'],results[1],UDATE,'0200')[0]
+    assert_rows_match(psa_df,'PSANationalCode',expected)
+
+def test_duplicated_station(fixtures, results):
+    raws_df = fixtures['raws_df']
+    dup = raws_df.iloc[[0]].assign(OBJECTID=raws_df['OBJECTID'].max() + 1)
+    fd_df = compact_fems(fixtures['fems_df'].astype(FEMS_KEY_DTYPES).rename(columns=FEMS_COLUMNS))
+    dup_raws, dup_r2p = compute_raws(pandas.concat([raws_df,dup],ignore_index=True),fixtures['pra_df'],fd_df,
+                                     build_percentile_lookups(fixtures['per_df']),fems_dates(UDATE),UDATE,'0200')
+    pandas.testing.assert_frame_equal(dup_raws.iloc[:-1],results[0])
+    pandas.testing.assert_frame_equal(dup_raws.iloc[[-1]].drop(columns=['OBJECTID']).reset_index(drop=True),
+                                      results[0].iloc[[0]].drop(columns=['OBJECTID']).reset_index(drop=True))
+    pandas.testing.assert_frame_equal(dup_r2p,results[1])
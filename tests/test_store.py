@@ -0,0 +1,105 @@
+'''
+Checks that incremental runs through the rolling store give the same results as full runs,
+including when observations reach FEMS late and when FEMS returns no records.
+'''
+
+# Import libraries and modules
+import pandas, pytest
+from nfdrs_trends import store
+from nfdrs_trends.fems import FEMS_COLUMNS, FEMS_KEY_DTYPES, fems_dates
+from nfdrs_trends.indices import DEFAULT_INDICES
+from nfdrs_trends.percentiles import build_percentile_lookups
+from nfdrs_trends.raws import compute_raws, compute_raws_incremental
+from nfdrs_trends.schema import compact_fems
+from nfdrs_trends.synthetic import make_fixtures
+
+CONFIG = {'indices': DEFAULT_INDICES}
+
+class FakeFEMS:
+    '''
+    Serves the fixture records as FEMS would on udate: days before udate as observations and
+    the rest as forecasts, without the (station, date) pairs in withheld.
+    '''
+    def __init__(self, fems_df):
+        self.fems_df = fems_df
+        self.udate = None
+        self.withheld = set()
+        self.requests = []
+
+    def __call__(self, config, sdate, edate, station_ids=None):
+        self.requests.append((sdate,edate,None if station_ids is None else sorted(station_ids)))
+        fd_df = self.fems_df.loc[(self.fems_df['summary_date'] >= sdate) &
+                                 (self.fems_df['summary_date'] <= edate)].copy()
+        if(station_ids is not None):
+            fd_df = fd_df.loc[fd_df['station_id'].isin(station_ids)]
+        keep = [(sid,day) not in self.withheld for sid, day in zip(fd_df['station_id'],fd_df['summary_date'])]
+        fd_df = fd_df.loc[keep]
+        fd_df['nfdr_type'] = ['O' if day < self.udate else 'F' for day in fd_df['summary_date']]
+        fd_df = fd_df.reset_index(drop=True).astype(FEMS_KEY_DTYPES)
+        return compact_fems(fd_df.rename(columns=FEMS_COLUMNS))
+
+@pytest.fixture
+def fixtures():
+    return make_fixtures(200,udate='2025-09-11',last_date='2025-09-13')
+
+def run_full(fx, fems, udate):
+    dates = fems_dates(udate)
+    fd_df = fems(CONFIG,dates['o_sdate'],dates['f_edate'])
+    return compute_raws(fx['raws_df'],fx['pra_df'],fd_df,build_percentile_lookups(fx['per_df']),dates,
+                        udate,'0200')
+
+def run_incremental(fx, fems, rstore, udate):
+    dates = fems_dates(udate)
+    per_lookups = build_percentile_lookups(fx['per_df'])
+    fd_df = rstore.fetch(CONFIG,dates,fx['pra_df']['Station_ID'].tolist())
+    raws_df, raws2psa_df = compute_raws_incremental(fx['raws_df'],fx['pra_df'],fd_df,per_lookups,dates,
+                                                    udate,'0200',3,rstore.previous(per_lookups,3))
+    rstore.save(udate,raws_df,raws2psa_df,per_lookups,3)
+    return raws_df, raws2psa_df
+
+def assert_same(inc, full):
+    pandas.testing.assert_frame_equal(inc[0],full[0])
+    pandas.testing.assert_frame_equal(inc[1],full[1])
+
+def test_incremental_matches_full(fixtures, tmp_path, monkeypatch):
+    fems = FakeFEMS(fixtures['fems_df'])
+    monkeypatch.setattr(store,'fetch_fems_data',fems)
+    for udate in ['2025-09-11','2025-09-12','2025-09-13']:
+        fems.udate = udate
+        fems.requests = []
+        inc = run_incremental(fixtures,fems,store.RollingStore(str(tmp_path)),udate)
+        assert_same(inc,run_full(fixtures,fems,udate))
+
+    # The last run downloads yesterday, which was stored as a forecast, and the forecast days, and
+    # only the stations with gaps in the earlier days
+    assert fems.requests[0][0:2] == ('2025-09-10','2025-09-11')
+    assert len(fems.requests[0][2]) < len(fems.requests[1][2])
+    assert fems.requests[1][0:2] == ('2025-09-12','2025-09-15')
+
+def test_late_observations_are_requested_again(fixtures, tmp_path, monkeypatch):
+    fems = FakeFEMS(fixtures['fems_df'])
+    monkeypatch.setattr(store,'fetch_fems_data',fems)
+    late_ids = sorted(fixtures['pra_df']['Station_ID'].unique())[:5]
+
+    # Yesterday's observations of some stations haven't reached FEMS on the first run
+    fems.udate = '2025-09-12'
+    fems.withheld = {(sid,'2025-09-11') for sid in late_ids}
+    run_incremental(fixtures,fems,store.RollingStore(str(tmp_path)),'2025-09-12')
+
+    # They have by the next run, which requests them again for that day only
+    fems.udate = '2025-09-13'
+    fems.withheld = set()
+    fems.requests = []
+    inc = run_incremental(fixtures,fems,store.RollingStore(str(tmp_path)),'2025-09-13')
+    assert set(late_ids) <= set(fems.requests[0][2])
+    assert fems.requests[1][0] == '2025-09-12'
+    assert_same(inc,run_full(fixtures,fems,'2025-09-13'))
+
+def test_empty_pull(fixtures, tmp_path, monkeypatch):
+    fems = FakeFEMS(fixtures['fems_df'].iloc[0:0])
+    monkeypatch.setattr(store,'fetch_fems_data',fems)
+    fems.udate = '2025-09-11'
+    for i in range(0,2): # Empty store, then a store saved from an empty pull
+        inc = run_incremental(fixtures,fems,store.RollingStore(str(tmp_path)),'2025-09-11')
+        assert_same(inc,run_full(fixtures,fems,'2025-09-11'))
+        assert inc[0]['erc'].isna().all()